@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the BLE scan service TPMS path
+
+Replays a capture or synthetic TPMS events through LEAdvertisingScanner,
+the scan service demultiplexer and the TPMS handlers, with MQTT replaced
+by a counter. Reports packets/s, latency percentiles from the event
+timestamp to the end of its handler, CPU time and memory blocks per
+packet. Tire macs are read from motorhome.conf like in the service.
+
+With --adapters N every event is replayed by N adapters, the RSSI of the
+copies falling by 5 dB per adapter, through the cross-adapter dedupe.
+The benchmark fails if a copy of a weaker adapter is handed over.
+
+    ble_benchmark.py -n 100000
+    ble_benchmark.py -n 20000 --rate 2000 --reports 4
+    ble_benchmark.py -n 20000 --rate 2000 --adapters 2
+    ble_benchmark.py --capture capture.btsnoop
+"""
+import sys
+import time
+import asyncio
+import argparse
+import configparser
+from array import array
+from pathlib import Path
+
+from bluetooth_utils import LEAdvertisingScanner
+from hci_capture import ReplaySocket, read_btsnoop, synthetic_tpms_events
+from ble_service import BLEScanService, DEDUPE_WINDOW
+from decoders import get_decoders
+from tpms import TPMS
+
+class NullClient:
+    """ MQTT client counting publishes """
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published += 1
+
+    def publish_state(self, topic, message, binary=False, retain=True):
+        self.published += 1
+
+class TimedService(BLEScanService):
+    """ Scan service recording when each advert has been handled """
+    def __init__(self, client, dev_ids):
+        BLEScanService.__init__(self, client, dev_ids, DEDUPE_WINDOW)
+        self.latency = array('d')
+
+    def deliver(self, mac, data, rssi, timestamp):
+        BLEScanService.deliver(self, mac, data, rssi, timestamp)
+        self.latency.append(time.time() - timestamp)
+
+def adapter_copy(packet, adapter):
+    """ packet as heard by another adapter, rssi of every report lower """
+    packet = bytearray(packet)
+    # packet type, event code, length, subevent, number of reports
+    offset = 5
+    for _ in range(packet[4]):
+        # event type, address type, address, data length, data, rssi
+        offset += 9 + packet[offset + 8]
+        packet[offset] = (packet[offset] - 5*adapter) & 0xFF
+        offset += 1
+    return bytes(packet)
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values)*p/100))]
+
+def run_benchmark(packets, rate=None, adapters=1):
+    conf_file = str(Path.home()) + "/.motorhome/motorhome.conf"
+    config = configparser.ConfigParser()
+    config.read(conf_file)
+
+    client = NullClient()
+    service = TimedService(client, range(adapters))
+    service.register(TPMS(client, get_decoders(config)))
+
+    if adapters > 1:
+        packets = list(packets)
+    socks = [ReplaySocket(packets if adapter == 0 else
+                          ((t, adapter_copy(packet, adapter)) for t, packet in packets),
+                          rate=rate, restamp=True)
+             for adapter in range(adapters)]
+    scanners = [LEAdvertisingScanner(sock, raw=True) for sock in socks]
+
+    start = time.perf_counter()
+    cpu = time.process_time()
+    blocks = sys.getallocatedblocks()
+
+    asyncio.run(service.scan(scanners))
+
+    blocks = sys.getallocatedblocks() - blocks
+    cpu = time.process_time() - cpu
+    elapsed = time.perf_counter() - start
+    for scanner in scanners:
+        scanner.close()
+    for sock in socks:
+        sock.close()
+
+    count = len(service.latency)
+    if count == 0:
+        print("no packets")
+        return 1
+
+    latency = sorted(service.latency)
+    print("%d events, %d packets in %.2f s, %d published" %
+          (socks[0].sent, count, elapsed, client.published))
+    if adapters > 1:
+        print("received per adapter %s, best copy %s" %
+              (service.adapter_packets, service.adapter_wins))
+    print("%.0f packets/s, %.2f us CPU/packet" %
+          (count/elapsed, cpu/count*1000000))
+    print("latency us: p50 %.1f p90 %.1f p99 %.1f max %.1f" %
+          tuple(1000000*v for v in (percentile(latency, 50),
+                                    percentile(latency, 90),
+                                    percentile(latency, 99),
+                                    latency[-1])))
+    print("%.3f memory blocks/packet retained" % (blocks/count))
+
+    # the copies of adapter 0 have the best RSSI
+    if sum(service.adapter_wins[1:]):
+        print("FAIL: weaker adapter copy handed over %d times" %
+              sum(service.adapter_wins[1:]))
+        return 1
+    return 0
+
+def tire_macs():
+    """ tire sensor macs of the service configuration """
+    conf_file = str(Path.home()) + "/.motorhome/motorhome.conf"
+    config = configparser.ConfigParser()
+    config.read(conf_file)
+    tpms = TPMS(NullClient(), get_decoders(config))
+
+    return [':'.join('%02X' % b for b in reversed(addr)) for addr in tpms.handlers()]
+
+def main():
+    parser = argparse.ArgumentParser(description="BLE TPMS path benchmark")
+    parser.add_argument('--capture', help="btsnoop capture to replay")
+    parser.add_argument('-n', '--count', type=int, default=100000,
+                        help="synthetic events")
+    parser.add_argument('--reports', type=int, default=1,
+                        help="reports per synthetic event")
+    parser.add_argument('--rate', type=float,
+                        help="events/s, default as fast as possible")
+    parser.add_argument('--adapters', type=int, default=1,
+                        help="adapters replaying every event")
+    args = parser.parse_args()
+
+    if args.capture:
+        packets = read_btsnoop(args.capture)
+    else:
+        macs = tire_macs()
+        if not macs:
+            print("no tire sensors configured")
+            return 1
+        packets = synthetic_tpms_events(macs, args.count, args.reports)
+
+    return run_benchmark(packets, args.rate, args.adapters)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+BLE scan service for motorhome infotainment
+
+The service owns the bluetooth adapter and hands every advertisement to
+the sensor registered for its address, so one scan feeds the TPMS
+sensors, the Ruuvitags and the sensors of the decoder registry. The scan
+duty cycle follows the vehicle state, see scan_scheduler.py.
+
+Several adapters can scan at once, e.g. the internal one and a USB dongle
+at the rear:
+
+[BLE]
+adapters = 0, 1
+dedupe_window = 0.05
+
+The same advert heard by more than one adapter within dedupe_window
+seconds is handed to the sensors once, with the best RSSI. An advert is
+handed over when every adapter has reported it or dedupe_window ends.
+"""
+import sys
+import time
+import asyncio
+import configparser
+from pathlib import Path
+
+import bluetooth._bluetooth as bluez
+
+# mqtt_payload, mqtt_publisher and live_state are shared with the GUI
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from bluetooth_utils import (toggle_device,
+                             enable_le_scan, disable_le_scan,
+                             open_le_scan_socket, LEAdvertisingScanner,
+                             le_read_white_list_size, le_clear_white_list,
+                             le_add_white_list,
+                             LE_PUBLIC_ADDRESS, LE_RANDOM_ADDRESS,
+                             FILTER_POLICY_NO_WHITELIST,
+                             FILTER_POLICY_SCAN_WHITELIST)
+from tpms import TPMS
+from ruuvitag import Ruuvitag, get_ruuvitag_macs
+from decoders import SensorRegistry, get_decoders
+from scan_scheduler import ScanScheduler
+from mqtt_payload import get_binary_topics
+from mqtt_publisher import Publisher
+from live_state import get_state_dir
+
+# interval of the packet rate report in seconds
+STATS_INTERVAL = 60
+
+# seconds between heartbeats of the sensors
+HEARTBEAT_INTERVAL = 1
+
+# seconds to wait for copies of an advert from the other adapters
+DEDUPE_WINDOW = 0.05
+
+class BLEScanService:
+    """ Scan BLE advertisements and demultiplex them to the sensors """
+    def __init__(self, client, dev_ids=(0,), dedupe_window=DEDUPE_WINDOW):
+        self.client = client
+        self.dev_ids = list(dev_ids)
+        self.sensors = []
+        self.handlers = {}
+        self.ctl_socks = []
+
+        # adverts waiting for copies from other adapters, by address and data:
+        # [best rssi, timestamp, best adapter, rssi by adapter, timer],
+        # kept one more window after delivery (timer None) to drop late copies
+        self.dedupe_window = dedupe_window
+        self.pending = {}
+        # rssi by adapter name of the advert being handled, None for one adapter
+        self.adapter_rssi = None
+        self.adapter_packets = [0]*len(self.dev_ids)
+        self.adapter_wins = [0]*len(self.dev_ids)
+
+        # handler of adverts from addresses not in the index
+        self.fallback = None
+
+        self.scheduler = None
+        self.scan_params = (0x0800, 0x0800)
+        self.filter_policies = [FILTER_POLICY_NO_WHITELIST]*len(self.dev_ids)
+
+        self.packets = 0
+        self.packets_reported = 0
+        self.stats_time = time.monotonic()
+        self.stats_cpu = time.process_time()
+
+        client.on_connect = self.on_connect
+
+    def register(self, sensor):
+        """ add a sensor, it gets the adverts of its addresses """
+        sensor.service = self
+        self.sensors.append(sensor)
+        self.update()
+
+    def set_fallback(self, handler):
+        """ get adverts of all other addresses, disables the white list """
+        self.fallback = handler
+        self.update()
+
+    def set_scheduler(self, scheduler):
+        """ let scheduler set the scan parameters """
+        self.scheduler = scheduler
+        self.register(scheduler)
+
+    def set_scan_params(self, interval, window):
+        """ change scan interval and window, keep the white list """
+        self.scan_params = (interval, window)
+        if self.ctl_socks:
+            self.start_scan(white_list=False)
+
+    def packets_total(self):
+        """ packets handled since start """
+        return self.packets_reported + self.packets
+
+    def update(self):
+        """ rebuild the address index and the controller white list """
+        handlers = {}
+        for sensor in self.sensors:
+            handlers.update(sensor.handlers())
+
+        # replace the whole index at once, the scanner never sees a partial one
+        self.handlers = handlers
+
+        if self.ctl_socks:
+            self.start_scan()
+
+    def on_connect(self, client, userdata, flags, rc):
+        print("BLE: connected to MQTT broker with result code " + str(rc))
+        for sensor in self.sensors:
+            sensor.subscribe(client)
+
+    def set_white_list(self, ctl_sock):
+        """ load all sensor addresses to the controller white list """
+        if self.fallback is not None:
+            raise IOError("adverts of all addresses needed")
+
+        macs = [bluez.ba2str(addr) for addr in self.handlers]
+        size = le_read_white_list_size(ctl_sock)
+
+        # sensor address types are not configured, add both types if they fit
+        if 2*len(macs) <= size:
+            addr_types = (LE_PUBLIC_ADDRESS, LE_RANDOM_ADDRESS)
+        elif len(macs) <= size:
+            addr_types = (LE_PUBLIC_ADDRESS,)
+        else:
+            raise IOError("white list too small for %d sensors" % len(macs))
+
+        le_clear_white_list(ctl_sock)
+        for mac in macs:
+            for addr_type in addr_types:
+                le_add_white_list(ctl_sock, mac, addr_type)
+
+    def start_scan(self, white_list=True):
+        """ (re)start scanning, let the controllers drop foreign adverts """
+        interval, window = self.scan_params
+
+        for i, ctl_sock in enumerate(self.ctl_socks):
+            # white list and parameters can be changed only while scanning is disabled
+            disable_le_scan(ctl_sock)
+
+            if white_list:
+                try:
+                    self.set_white_list(ctl_sock)
+                    self.filter_policies[i] = FILTER_POLICY_SCAN_WHITELIST
+                except (IOError, OSError) as err:
+                    print("BLE: hci%d white list not in use: %s" % (self.dev_ids[i], err))
+                    self.filter_policies[i] = FILTER_POLICY_NO_WHITELIST
+
+            enable_le_scan(ctl_sock, interval=interval, window=window,
+                           filter_policy=self.filter_policies[i],
+                           filter_duplicates=True)
+
+    def open(self):
+        """ power on the adapters and start scanning, returns the scan sockets """
+        socks = []
+        for dev_id in self.dev_ids:
+            toggle_device(dev_id, True)
+
+            try:
+                socks.append(bluez.hci_open_dev(dev_id))
+                # controller commands go through their own socket
+                self.ctl_socks.append(bluez.hci_open_dev(dev_id))
+            except:
+                print("Cannot open bluetooth device %i" % dev_id)
+                raise
+
+        self.start_scan()
+
+        return socks
+
+    def report_stats(self, now):
+        """ print handled packet rate """
+        cpu = time.process_time()
+        elapsed = now - self.stats_time
+        cpu_used = cpu - self.stats_cpu
+
+        print("BLE: %d packets in %.0f s, %.1f packets/s, %.0f packets/CPU-s" %
+              (self.packets, elapsed, self.packets/elapsed,
+               self.packets/cpu_used if cpu_used > 0 else 0.0))
+
+        if len(self.dev_ids) > 1:
+            for i, dev_id in enumerate(self.dev_ids):
+                print("BLE: hci%d %d packets, best copy of %d" %
+                      (dev_id, self.adapter_packets[i], self.adapter_wins[i]))
+                self.adapter_packets[i] = 0
+                self.adapter_wins[i] = 0
+
+        self.packets_reported += self.packets
+        self.packets = 0
+        self.stats_time = now
+        self.stats_cpu = cpu
+
+        if self.scheduler is not None:
+            self.scheduler.report()
+
+    def deliver(self, mac, data, rssi, timestamp):
+        """ hand an advert to its sensor """
+        self.packets += 1
+        handler = self.handlers.get(mac)
+        if handler is not None:
+            handler(data, rssi, timestamp)
+        elif self.fallback is not None:
+            self.fallback(mac, data, rssi, timestamp)
+
+        now = time.monotonic()
+        if now - self.stats_time > STATS_INTERVAL:
+            self.report_stats(now)
+
+    async def dispatch(self, scanner):
+        """ hand the adverts of scanner to the sensors """
+        async for mac, adv_type, data, rssi, timestamp in scanner:
+            self.deliver(mac, data, rssi, timestamp)
+            # let the MQTT client run between adverts of a busy scanner
+            await asyncio.sleep(0)
+
+    async def collect(self, adapter, scanner):
+        """ merge the adverts of one of several adapters """
+        loop = asyncio.get_running_loop()
+        name = "hci%d" % self.dev_ids[adapter]
+
+        async for mac, adv_type, data, rssi, timestamp in scanner:
+            self.adapter_packets[adapter] += 1
+            if self.fallback is None and mac not in self.handlers:
+                continue
+
+            adverts = self.pending.setdefault(mac, {})
+            data = bytes(data)
+            pending = adverts.get(data)
+            if pending is None:
+                adverts[data] = [rssi, timestamp, adapter, {name: rssi},
+                                 loop.call_later(self.dedupe_window, self.flush, mac, data)]
+            else:
+                # copy from another adapter, or a late one of a delivered advert
+                pending[3][name] = rssi
+                if rssi > pending[0]:
+                    pending[0] = rssi
+                    pending[2] = adapter
+
+                # every adapter has reported the advert, no need to wait
+                if pending[4] is not None and len(pending[3]) == len(self.dev_ids):
+                    pending[4].cancel()
+                    self.flush(mac, data)
+
+            # let the other scanners and the MQTT client run between adverts
+            await asyncio.sleep(0)
+
+    def flush(self, mac, data):
+        """ hand the best copy of a pending advert to its sensor """
+        pending = self.pending[mac][data]
+        pending[4] = None
+
+        rssi, timestamp, adapter, self.adapter_rssi, _ = pending
+        self.adapter_wins[adapter] += 1
+        self.deliver(mac, data, rssi, timestamp)
+        self.adapter_rssi = None
+
+        asyncio.get_running_loop().call_later(self.dedupe_window, self.expire,
+                                              mac, data)
+
+    def expire(self, mac, data):
+        """ forget a delivered advert """
+        adverts = self.pending[mac]
+        del adverts[data]
+        if not adverts:
+            del self.pending[mac]
+
+    async def scan(self, scanners):
+        """ hand the adverts of all scanners to the sensors """
+        if len(scanners) == 1:
+            await self.dispatch(scanners[0])
+        else:
+            await asyncio.gather(*(self.collect(adapter, scanner)
+                                   for adapter, scanner in enumerate(scanners)))
+
+            # scanners have ended, hand over the adverts still waiting
+            for mac, adverts in list(self.pending.items()):
+                for data, pending in list(adverts.items()):
+                    if pending[4] is not None:
+                        pending[4].cancel()
+                        self.flush(mac, data)
+
+    async def heartbeat(self):
+        """ let the sensors publish without adverts """
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            now = time.time()
+            for sensor in self.sensors:
+                if hasattr(sensor, 'heartbeat'):
+                    sensor.heartbeat(now)
+
+    async def run(self, socks):
+        """ read adverts and the MQTT client on one event loop """
+        network = asyncio.create_task(self.client.run())
+        heartbeat = asyncio.create_task(self.heartbeat())
+
+        hci_socks = [open_le_scan_socket(sock)[0] for sock in socks]
+        scanners = [LEAdvertisingScanner(hci_sock, raw=True) for hci_sock in hci_socks]
+
+        try:
+            await self.scan(scanners)
+        finally:
+            for scanner in scanners:
+                scanner.close()
+            for hci_sock in hci_socks:
+                hci_sock.close()
+            network.cancel()
+            heartbeat.cancel()
+            await asyncio.gather(network, heartbeat, return_exceptions=True)
+
+def run_ble_service():
+    conf_file = str(Path.home()) + "/.motorhome/motorhome.conf"
+    config = configparser.ConfigParser()
+    config.read(conf_file)
+    decoders = get_decoders(config)
+
+    try:
+        dev_ids = [int(dev_id) for dev_id in config.get('BLE', 'adapters', fallback='0').split(',')]
+        dedupe_window = config.getfloat('BLE', 'dedupe_window', fallback=DEDUPE_WINDOW)
+    except ValueError as err:
+        print("BLE: invalid value in [BLE]: " + str(err))
+        dev_ids = [0]
+        dedupe_window = DEDUPE_WINDOW
+
+    client = Publisher("BLE", state_dir=get_state_dir(conf_file))
+    service = BLEScanService(client, dev_ids, dedupe_window)
+    service.set_scheduler(ScanScheduler(client))
+
+    service.register(TPMS(client, decoders))
+
+    binary = 'ruuvitag' in get_binary_topics(conf_file)
+    macs = get_ruuvitag_macs(conf_file)
+    for location, mac in macs.items():
+        service.register(Ruuvitag(client, mac, location, binary))
+
+    registry = SensorRegistry(client)
+    registry.load(config, decoders)
+    service.register(registry)
+    if registry.needs_all_adverts():
+        service.set_fallback(registry.handle)
+
+    try:
+        socks = service.open()
+    except PermissionError:
+        print("BLE: No permission for bluetooth")
+        return
+
+    asyncio.run(service.run(socks))
+
+if __name__ == "__main__":
+    run_ble_service()
@@ -0,0 +1,687 @@
+# -*- coding: utf-8 -*-
+"""
+Module containing some bluetooth utility functions (linux only).
+
+It either uses HCI commands using PyBluez, or does ioctl calls like it's
+done in Bluez tools such as hciconfig.
+
+Main functions:
+  - toggle_device : enable or disable a bluetooth device
+  - set_scan : set scan type on a device ("noscan", "iscan", "pscan", "piscan")
+  - enable/disable_le_scan : enable BLE scanning
+  - parse_le_advertising_events : parse and read BLE advertisements packets
+  - iter_le_advertising_reports : walk the reports of one advertising event
+  - LEAdvertisingScanner : asyncio iterator of BLE advertisement reports
+  - start/stop_le_advertising : advertise custom data using BLE
+  - le_clear/add_white_list : manage the controller white list
+
+Bluez : http://www.bluez.org/
+PyBluez : http://karulis.github.io/pybluez/
+
+The module was in particular inspired from 'iBeacon-Scanner-'
+https://github.com/switchdoclabs/iBeacon-Scanner-/blob/master/blescan.py
+and sometimes directly from the Bluez sources.
+"""
+
+from __future__ import absolute_import
+import sys
+import time
+import struct
+import fcntl
+import array
+import socket
+import asyncio
+from errno import EALREADY, EIO
+
+# import PyBluez
+import bluetooth._bluetooth as bluez
+
+__all__ = ('toggle_device', 'set_scan',
+           'enable_le_scan', 'disable_le_scan', 'parse_le_advertising_events',
+           'iter_le_advertising_reports', 'open_le_scan_socket',
+           'LEAdvertisingScanner',
+           'start_le_advertising', 'stop_le_advertising',
+           'raw_packet_to_str', 'str_to_bdaddr', 'find_manufacturer_data',
+           'iter_ad_structures',
+           'le_read_white_list_size', 'le_clear_white_list',
+           'le_add_white_list', 'le_remove_white_list')
+
+LE_META_EVENT = 0x3E
+HCI_MAX_EVENT_SIZE = 260
+
+# HCI socket options (not exported by PyBluez)
+SOL_HCI = 0
+HCI_TIME_STAMP = 3
+HCI_CMSG_TSTAMP = 0x0002
+TIMEVAL = struct.Struct("@ll")
+LE_PUBLIC_ADDRESS = 0x00
+LE_RANDOM_ADDRESS = 0x01
+
+OGF_LE_CTL = 0x08
+OCF_LE_SET_SCAN_PARAMETERS = 0x000B
+OCF_LE_SET_SCAN_ENABLE = 0x000C
+OCF_LE_CREATE_CONN = 0x000D
+OCF_LE_SET_ADVERTISING_PARAMETERS = 0x0006
+OCF_LE_SET_ADVERTISE_ENABLE = 0x000A
+OCF_LE_SET_ADVERTISING_DATA = 0x0008
+OCF_LE_READ_WHITE_LIST_SIZE = 0x000F
+OCF_LE_CLEAR_WHITE_LIST = 0x0010
+OCF_LE_ADD_DEVICE_TO_WHITE_LIST = 0x0011
+OCF_LE_REMOVE_DEVICE_FROM_WHITE_LIST = 0x0012
+
+SCAN_TYPE_PASSIVE = 0x00
+SCAN_FILTER_DUPLICATES = 0x01
+SCAN_DISABLE = 0x00
+SCAN_ENABLE = 0x01
+
+# sub-events of LE_META_EVENT
+EVT_LE_CONN_COMPLETE = 0x01
+EVT_LE_ADVERTISING_REPORT = 0x02
+EVT_LE_CONN_UPDATE_COMPLETE = 0x03
+EVT_LE_READ_REMOTE_USED_FEATURES_COMPLETE = 0x04
+
+# AD types of advertising data
+AD_SERVICE_DATA_16 = 0x16
+AD_MANUFACTURER_SPECIFIC_DATA = 0xFF
+
+# Advertisement event types
+ADV_IND = 0x00
+ADV_DIRECT_IND = 0x01
+ADV_SCAN_IND = 0x02
+ADV_NONCONN_IND = 0x03
+ADV_SCAN_RSP = 0x04
+
+# Allow Scan Request from Any, Connect Request from Any
+FILTER_POLICY_NO_WHITELIST = 0x00
+# Allow Scan Request from White List Only, Connect Request from Any
+FILTER_POLICY_SCAN_WHITELIST = 0x01
+# Allow Scan Request from Any, Connect Request from White List Only
+FILTER_POLICY_CONN_WHITELIST = 0x02
+# Allow Scan Request from White List Only, Connect Request from White List Only
+FILTER_POLICY_SCAN_AND_CONN_WHITELIST = 0x03
+
+
+def toggle_device(dev_id, enable):
+    """
+    Power ON or OFF a bluetooth device.
+
+    :param dev_id: Device id.
+    :type dev_id: ``int``
+    :param enable: Whether to enable of disable the device.
+    :type enable: ``bool``
+    """
+    hci_sock = socket.socket(socket.AF_BLUETOOTH,
+                             socket.SOCK_RAW,
+                             socket.BTPROTO_HCI)
+    print("Power %s bluetooth device %d" % ('ON' if enable else 'OFF', dev_id))
+    # di = struct.pack("HbBIBBIIIHHHH10I", dev_id, *((0,) * 22))
+    # fcntl.ioctl(hci_sock.fileno(), bluez.HCIGETDEVINFO, di)
+    req_str = struct.pack("H", dev_id)
+    request = array.array("b", req_str)
+    try:
+        fcntl.ioctl(hci_sock.fileno(),
+                    bluez.HCIDEVUP if enable else bluez.HCIDEVDOWN,
+                    request[0])
+    except IOError as e:
+        if e.errno == EALREADY:
+            print("Bluetooth device %d is already %s" % (
+                  dev_id, 'enabled' if enable else 'disabled'))
+        else:
+            raise
+    finally:
+        hci_sock.close()
+
+
+# Types of bluetooth scan
+SCAN_DISABLED = 0x00
+SCAN_INQUIRY = 0x01
+SCAN_PAGE = 0x02
+
+
+def set_scan(dev_id, scan_type):
+    """
+    Set scan type on a given bluetooth device.
+
+    :param dev_id: Device id.
+    :type dev_id: ``int``
+    :param scan_type: One of
+        ``'noscan'``
+        ``'iscan'``
+        ``'pscan'``
+        ``'piscan'``
+    :type scan_type: ``str``
+    """
+    hci_sock = socket.socket(socket.AF_BLUETOOTH,
+                             socket.SOCK_RAW,
+                             socket.BTPROTO_HCI)
+    if scan_type == "noscan":
+        dev_opt = SCAN_DISABLED
+    elif scan_type == "iscan":
+        dev_opt = SCAN_INQUIRY
+    elif scan_type == "pscan":
+        dev_opt = SCAN_PAGE
+    elif scan_type == "piscan":
+        dev_opt = SCAN_PAGE | SCAN_INQUIRY
+    else:
+        raise ValueError("Unknown scan type %r" % scan_type)
+
+    req_str = struct.pack("HI", dev_id, dev_opt)
+    print("Set scan type %r to bluetooth device %d" % (scan_type, dev_id))
+    try:
+        fcntl.ioctl(hci_sock.fileno(), bluez.HCISETSCAN, req_str)
+    finally:
+        hci_sock.close()
+
+
+def raw_packet_to_str(pkt):
+    """
+    Returns the string representation of a raw HCI packet.
+    """
+    if sys.version_info > (3, 0):
+        return ''.join('%02x' % struct.unpack("B", bytes([x]))[0] for x in pkt)
+    else:
+        return ''.join('%02x' % struct.unpack("B", x)[0] for x in pkt)
+
+
+def str_to_bdaddr(mac):
+    """
+    Returns the raw 6-byte address (as carried in HCI packets) of a mac
+    address representation ('00:2A:5F:FF:25:11').
+    """
+    return bytes.fromhex(mac.replace(':', ''))[::-1]
+
+
+def iter_ad_structures(data):
+    """
+    Iterate over the AD structures of advertising data.
+
+    :param data: Advertising data as reported by
+        :func:`.parse_le_advertising_events` (starting with the data length).
+    :returns: Generator of (ad_type, start, end) tuples, where start is the
+        offset of the data following the AD type and end the offset after
+        the AD structure.
+    """
+    offset = 1
+    end = len(data)
+
+    while offset + 1 < end:
+        length = data[offset]
+        if length == 0:
+            break
+
+        ad_end = offset + 1 + length
+        if ad_end > end:
+            break
+
+        yield data[offset + 1], offset + 2, ad_end
+
+        offset = ad_end
+
+
+def find_manufacturer_data(data, company_id):
+    """
+    Locate the manufacturer specific data of a company in advertising data.
+
+    :param data: Advertising data as reported by
+        :func:`.parse_le_advertising_events` (starting with the data length).
+    :param company_id: Bluetooth SIG company identifier.
+    :type company_id: ``int``
+    :returns: Offset of the data following the company identifier and the
+        end offset of the AD structure, or (-1, -1) if not found.
+    """
+    offset = 1
+    end = len(data)
+
+    while offset + 1 < end:
+        length = data[offset]
+        if length == 0:
+            break
+
+        ad_end = offset + 1 + length
+        if ad_end > end:
+            break
+
+        if (data[offset + 1] == AD_MANUFACTURER_SPECIFIC_DATA and length >= 3
+                and data[offset + 2] | data[offset + 3] << 8 == company_id):
+            return offset + 4, ad_end
+
+        offset = ad_end
+
+    return -1, -1
+
+
+def enable_le_scan(sock, interval=0x0800, window=0x0800,
+                   filter_policy=FILTER_POLICY_NO_WHITELIST,
+                   filter_duplicates=True):
+    """
+    Enable LE passive scan (with filtering of duplicate packets enabled).
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    :param interval: Scan interval.
+    :param window: Scan window (must be less or equal than given interval).
+    :param filter_policy: One of
+        ``FILTER_POLICY_NO_WHITELIST`` (default value)
+        ``FILTER_POLICY_SCAN_WHITELIST``
+        ``FILTER_POLICY_CONN_WHITELIST``
+        ``FILTER_POLICY_SCAN_AND_CONN_WHITELIST``
+
+    .. note:: Scan interval and window are to multiply by 0.625 ms to
+        get the real time duration.
+    """
+    print("Enable LE scan")
+    own_bdaddr_type = LE_PUBLIC_ADDRESS  # does not work with LE_RANDOM_ADDRESS
+    cmd_pkt = struct.pack("<BHHBB", SCAN_TYPE_PASSIVE, interval, window,
+                          own_bdaddr_type, filter_policy)
+    bluez.hci_send_cmd(sock, OGF_LE_CTL, OCF_LE_SET_SCAN_PARAMETERS, cmd_pkt)
+    print("scan params: interval=%.3fms window=%.3fms own_bdaddr=%s "
+          "whitelist=%s" %
+          (interval * 0.625, window * 0.625,
+           'public' if own_bdaddr_type == LE_PUBLIC_ADDRESS else 'random',
+           'yes' if filter_policy in (FILTER_POLICY_SCAN_WHITELIST,
+                                      FILTER_POLICY_SCAN_AND_CONN_WHITELIST)
+           else 'no'))
+    cmd_pkt = struct.pack("<BB", SCAN_ENABLE, SCAN_FILTER_DUPLICATES if filter_duplicates else 0x00)
+    bluez.hci_send_cmd(sock, OGF_LE_CTL, OCF_LE_SET_SCAN_ENABLE, cmd_pkt)
+
+
+def disable_le_scan(sock):
+    """
+    Disable LE scan.
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    """
+    print("Disable LE scan")
+    cmd_pkt = struct.pack("<BB", SCAN_DISABLE, 0x00)
+    bluez.hci_send_cmd(sock, OGF_LE_CTL, OCF_LE_SET_SCAN_ENABLE, cmd_pkt)
+
+
+def start_le_advertising(sock, min_interval=1000, max_interval=1000,
+                         adv_type=ADV_NONCONN_IND, data=()):
+    """
+    Start LE advertising.
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    :param min_interval: Minimum advertising interval.
+    :param max_interval: Maximum advertising interval.
+    :param adv_type: Advertisement type (``ADV_NONCONN_IND`` by default).
+    :param data: The advertisement data (maximum of 31 bytes).
+    :type data: iterable
+    """
+    own_bdaddr_type = 0
+    direct_bdaddr_type = 0
+    direct_bdaddr = (0,) * 6
+    chan_map = 0x07  # All channels: 37, 38, 39
+    filter = 0
+
+    struct_params = [min_interval, max_interval, adv_type, own_bdaddr_type,
+                     direct_bdaddr_type]
+    struct_params.extend(direct_bdaddr)
+    struct_params.extend((chan_map, filter))
+
+    cmd_pkt = struct.pack("<HHBBB6BBB", *struct_params)
+    bluez.hci_send_cmd(sock, OGF_LE_CTL, OCF_LE_SET_ADVERTISING_PARAMETERS,
+                       cmd_pkt)
+
+    cmd_pkt = struct.pack("<B", 0x01)
+    bluez.hci_send_cmd(sock, OGF_LE_CTL, OCF_LE_SET_ADVERTISE_ENABLE, cmd_pkt)
+
+    data_length = len(data)
+    if data_length > 31:
+        raise ValueError("data is too long (%d but max is 31 bytes)",
+                         data_length)
+    cmd_pkt = struct.pack("<B%dB" % data_length, data_length, *data)
+    bluez.hci_send_cmd(sock, OGF_LE_CTL, OCF_LE_SET_ADVERTISING_DATA, cmd_pkt)
+    print("Advertising started data_length=%d data=%r" % (data_length, data))
+
+
+def stop_le_advertising(sock):
+    """
+    Stop LE advertising.
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    """
+    cmd_pkt = struct.pack("<B", 0x00)
+    bluez.hci_send_cmd(sock, OGF_LE_CTL, OCF_LE_SET_ADVERTISE_ENABLE, cmd_pkt)
+    print("Advertising stopped")
+
+
+def iter_le_advertising_reports(pkt):
+    """
+    Iterate over all advertising reports of one ``EVT_LE_ADVERTISING_REPORT``
+    event.
+
+    The controller may batch several reports into one event, each report
+    being laid out as event type, address type, address (6 bytes), data
+    length, data and RSSI. Reports are located with offset arithmetic on a
+    memoryview of the packet, the packet itself is never sliced.
+
+    :param pkt: Raw HCI event packet (starting with the packet type).
+    :type pkt: ``bytes``
+    :returns: Generator of (address, adv_type, data, rssi, plen) tuples,
+        where address is the raw 6-byte address, data is a memoryview
+        starting with the data length byte and plen is the parameter
+        length a single report event carrying this report would have.
+    """
+    view = memoryview(pkt)
+    end = len(view)
+    num_reports = view[4]
+    offset = 5
+
+    for _ in range(num_reports):
+        if offset + 10 > end:
+            break
+        data_len = view[offset + 8]
+        rssi_offset = offset + 9 + data_len
+        if rssi_offset >= end:
+            break
+
+        rssi = view[rssi_offset]
+        if rssi > 127:
+            rssi -= 256
+
+        yield (bytes(view[offset + 2:offset + 8]), view[offset],
+               view[offset + 8:rssi_offset], rssi, data_len + 12)
+
+        offset = rssi_offset + 1
+
+
+def open_le_scan_socket(sock):
+    """
+    Open a socket for reading LE advertisements from a HCI device.
+
+    The HCI filter of ``sock`` is set to LE meta events and a duplicate
+    of it is returned, with kernel packet timestamps enabled. The returned
+    socket is read with ``MSG_DONTWAIT``, ``sock`` itself stays blocking.
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    :returns: Tuple of the socket and the previous HCI filter of ``sock``.
+    """
+    old_filter = sock.getsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, 14)
+
+    flt = bluez.hci_filter_new()
+    bluez.hci_filter_set_ptype(flt, bluez.HCI_EVENT_PKT)
+    # bluez.hci_filter_all_events(flt)
+    bluez.hci_filter_set_event(flt, LE_META_EVENT)
+    sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, flt)
+
+    print("socket filter set to ptype=HCI_EVENT_PKT event=LE_META_EVENT")
+
+    hci_sock = socket.fromfd(sock.fileno(), socket.AF_BLUETOOTH,
+                             socket.SOCK_RAW, socket.BTPROTO_HCI)
+    hci_sock.setsockopt(SOL_HCI, HCI_TIME_STAMP, 1)
+
+    return hci_sock, old_filter
+
+
+class LEAdvertisingScanner:
+    """
+    Asynchronous reader of LE advertisement reports.
+
+    Iterating the scanner yields (mac, adv_type, data, rssi, timestamp)
+    tuples for every report matching the filters, where timestamp is the
+    kernel receive time of the event (seconds since the epoch)::
+
+        async for mac, adv_type, data, rssi, timestamp in scanner:
+            ...
+
+    Events are received with ``recvmsg_into`` into one preallocated
+    buffer. ``data`` is a memoryview into that buffer and is only valid
+    until the next report is requested, copy it with ``bytes(data)`` to
+    keep it.
+
+    .. note:: LE scanning must be enabled with :func:`.enable_le_scan`.
+
+    :param sock: Socket returned by :func:`.open_le_scan_socket`, or any
+        object with ``fileno`` and ``recvmsg_into`` delivering HCI events.
+    :param mac_addr: Filtered mac addresses, see
+        :func:`.parse_le_advertising_events`.
+    :param packet_length: Filter a specific length of LE advertisement packet.
+    :param raw: Report mac addresses as raw 6-byte addresses.
+    :param debug: Enable debug prints of filtered reports.
+    :param recorder: Called with every LE advertising report event
+        (``memoryview``, starting with the HCI packet type) and its
+        timestamp, before the reports are filtered.
+    """
+    def __init__(self, sock, mac_addr=None, packet_length=None, raw=False,
+                 debug=False, recorder=None):
+        self.sock = sock
+        self.mac_addr = mac_addr
+        self.packet_length = packet_length
+        self.raw = raw
+        self.debug = debug
+        self.recorder = recorder
+        self.timestamp = 0.0
+
+        self._buf = bytearray(HCI_MAX_EVENT_SIZE)
+        self._view = memoryview(self._buf)
+        self._ancbufsize = socket.CMSG_SPACE(TIMEVAL.size)
+        self._reports = iter(())
+        # made on the running loop, an Event binds to a loop before Python 3.10
+        self._readable = None
+        self._loop = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        mac_addr = self.mac_addr
+        packet_length = self.packet_length
+
+        while True:
+            for addr, adv_type, data, rssi, report_len in self._reports:
+                if self.raw:
+                    mac = addr
+                else:
+                    mac = bluez.ba2str(addr)
+
+                if packet_length and report_len != packet_length:
+                    if self.debug:
+                        print("packet with non-matching length: mac=%s adv_type=%02x plen=%s" %
+                              (mac, adv_type, report_len))
+                        print(raw_packet_to_str(data))
+                    continue
+
+                if mac_addr and mac not in mac_addr:
+                    if self.debug:
+                        print("packet with non-matching mac %s adv_type=%02x data=%s RSSI=%s" %
+                              (mac, adv_type, raw_packet_to_str(data), rssi))
+                    continue
+
+                return mac, adv_type, data, rssi, self.timestamp
+
+            if not await self._recv_event():
+                raise StopAsyncIteration
+
+    async def _recv_event(self):
+        """ wait for the next LE advertising report event, False at EOF """
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._readable = asyncio.Event()
+            self._loop.add_reader(self.sock.fileno(), self._readable.set)
+
+        while True:
+            try:
+                nbytes, ancdata, _, _ = self.sock.recvmsg_into(
+                    (self._buf,), self._ancbufsize, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                self._readable.clear()
+                await self._readable.wait()
+                continue
+
+            if nbytes == 0:
+                # only replayed captures end, HCI sockets do not
+                return False
+
+            if nbytes < 5:
+                continue
+
+            if self._buf[1] != LE_META_EVENT:
+                # Should never occur because we filtered with this type of event
+                print("Not a LE_META_EVENT !")
+                continue
+
+            if self._buf[3] != EVT_LE_ADVERTISING_REPORT:
+                if self.debug:
+                    print("Not a EVT_LE_ADVERTISING_REPORT !")
+                continue
+
+            self.timestamp = time.time()
+            for level, msg_type, msg_data in ancdata:
+                if level == SOL_HCI and msg_type == HCI_CMSG_TSTAMP:
+                    sec, usec = TIMEVAL.unpack_from(msg_data)
+                    self.timestamp = sec + usec/1000000
+
+            if self.recorder is not None:
+                self.recorder(self._view[:nbytes], self.timestamp)
+
+            self._reports = iter_le_advertising_reports(self._view[:nbytes])
+            return True
+
+    def close(self):
+        """ stop watching the socket """
+        if self._loop is not None:
+            self._loop.remove_reader(self.sock.fileno())
+            self._loop = None
+
+
+def parse_le_advertising_events(sock, mac_addr=None, packet_length=None,
+                                handler=None, debug=False, raw=False):
+    """
+    Parse and report LE advertisements.
+
+    This is a blocking call, an infinite loop is started and the
+    given handler will be called each time a new LE advertisement packet
+    is detected and corresponds to the given filters. It runs a
+    :class:`.LEAdvertisingScanner` in its own asyncio event loop.
+
+    .. note:: The :func:`.start_le_advertising` function must be
+        called before calling this function.
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    :param mac_addr: list of filtered mac address representations
+        (uppercase, with ':' separators).
+        If not specified, the LE advertisement of any device will be reported.
+        Example: mac_addr=('00:2A:5F:FF:25:11', 'DA:FF:12:33:66:12')
+    :type mac_addr: ``list`` of ``string``
+    :param packet_length: Filter a specific length of LE advertisement packet.
+    :type packet_length: ``int``
+    :param handler: Handler that will be called each time a LE advertisement
+        packet is available (in accordance with the ``mac_addr``
+        and ``packet_length`` filters).
+    :type handler: ``callable`` taking 4 parameters:
+        mac (``str``), adv_type (``int``), data (``memoryview``) and rssi (``int``)
+    :param debug: Enable debug prints.
+    :type debug: ``bool``
+    :param raw: Report and filter mac addresses as raw 6-byte addresses
+        (see :func:`.str_to_bdaddr`) instead of strings. This skips the
+        string conversion of every received packet.
+    :type raw: ``bool``
+    """
+    if not debug and handler is None:
+        raise ValueError("You must either enable debug or give a handler !")
+
+    hci_sock, old_filter = open_le_scan_socket(sock)
+    scanner = LEAdvertisingScanner(hci_sock, mac_addr=mac_addr,
+                                   packet_length=packet_length, raw=raw,
+                                   debug=debug)
+
+    async def dispatch():
+        async for mac, adv_type, data, rssi, _ in scanner:
+            if debug:
+                print("LE advertisement: mac=%s adv_type=%02x data=%s RSSI=%d" %
+                      (mac, adv_type, raw_packet_to_str(data), rssi))
+
+            if handler is not None:
+                try:
+                    handler(mac, adv_type, data, rssi)
+                except Exception as e:
+                    print('Exception when calling handler with a BLE advertising event: %r' % (e,))
+                    import traceback
+                    traceback.print_exc()
+
+    print("Listening ...")
+
+    try:
+        asyncio.run(dispatch())
+    except KeyboardInterrupt:
+        print("\nRestore previous socket filter")
+        sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, old_filter)
+        raise
+    finally:
+        scanner.close()
+        hci_sock.close()
+
+
+def _le_send_req(sock, ocf, cmd_pkt=b"", rlen=1, timeout=1000):
+    """
+    Send a LE controller command and wait for its command complete event.
+
+    :raises IOError: if the controller returns a non-zero status.
+    :returns: The return parameters, starting with the status byte.
+    """
+    resp = bluez.hci_send_req(sock, OGF_LE_CTL, ocf, bluez.EVT_CMD_COMPLETE,
+                              rlen, cmd_pkt, timeout)
+    status = resp[0]
+    if status:
+        raise IOError(EIO, "LE command 0x%04x failed with status 0x%02x" %
+                      (ocf, status))
+
+    return resp
+
+
+def le_read_white_list_size(sock):
+    """
+    Read the number of entries the controller white list can hold.
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    """
+    resp = _le_send_req(sock, OCF_LE_READ_WHITE_LIST_SIZE, rlen=2)
+    return resp[1]
+
+
+def le_clear_white_list(sock):
+    """
+    Remove all devices from the controller white list.
+
+    .. note:: The white list cannot be changed while a scan using it
+        is enabled.
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    """
+    _le_send_req(sock, OCF_LE_CLEAR_WHITE_LIST)
+
+
+def le_add_white_list(sock, mac, addr_type=LE_PUBLIC_ADDRESS):
+    """
+    Add a device to the controller white list.
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    :param mac: Mac address representation (uppercase, with ':' separators).
+    :type mac: ``str``
+    :param addr_type: ``LE_PUBLIC_ADDRESS`` or ``LE_RANDOM_ADDRESS``.
+    """
+    cmd_pkt = struct.pack("<B6s", addr_type, str_to_bdaddr(mac))
+    _le_send_req(sock, OCF_LE_ADD_DEVICE_TO_WHITE_LIST, cmd_pkt)
+
+
+def le_remove_white_list(sock, mac, addr_type=LE_PUBLIC_ADDRESS):
+    """
+    Remove a device from the controller white list.
+
+    :param sock: A bluetooth HCI socket (retrieved using the
+        ``hci_open_dev`` PyBluez function).
+    :param mac: Mac address representation (uppercase, with ':' separators).
+    :type mac: ``str``
+    :param addr_type: ``LE_PUBLIC_ADDRESS`` or ``LE_RANDOM_ADDRESS``.
+    """
+    cmd_pkt = struct.pack("<B6s", addr_type, str_to_bdaddr(mac))
+    _le_send_req(sock, OCF_LE_REMOVE_DEVICE_FROM_WHITE_LIST, cmd_pkt)
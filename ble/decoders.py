@@ -0,0 +1,196 @@
+"""
+BLE sensor decoders
+
+A decoder is the struct layout of the sensor values in an advertisement:
+offset, struct format, field names and scale factors. Sensors are found
+by mac address, manufacturer id or 16-bit service UUID and every decoded
+reading is published in one format on /motorhome/sensors/<name>,
+retained.
+
+Decoders and sensors can be declared in motorhome.conf:
+
+[Decoder.tank_level]
+format = <xHB
+fields = level, battery
+scale = 0.1, 1
+offset = 0
+
+[Sensor.fresh_water]
+decoder = tank_level
+mac = C4:7C:8D:6A:12:34
+
+Instead of mac, 'manufacturer = <company id>' or 'service = <16-bit UUID>'
+finds the sensor by its manufacturer or service data. The offset is
+counted from the start of the manufacturer data (after the company id) or
+the service data (after the UUID), or from the start of the advertising
+data (its length byte) for sensors found by mac.
+"""
+import struct
+import json
+import configparser
+
+from bluetooth_utils import (iter_ad_structures, str_to_bdaddr,
+                             AD_SERVICE_DATA_16,
+                             AD_MANUFACTURER_SPECIFIC_DATA)
+
+class Decoder:
+    """ Struct layout of sensor values """
+    def __init__(self, name, fmt, fields, scale=None, offset=0):
+        self.name = name
+        self.layout = struct.Struct(fmt)
+        self.fields = tuple(fields)
+        self.scale = tuple(scale) if scale else (1,)*len(self.fields)
+        self.offset = offset
+
+        if len(self.fields) != len(self.scale):
+            raise ValueError("decoder %s: %d fields but %d scale factors" %
+                             (name, len(self.fields), len(self.scale)))
+
+    def unpack(self, data, start=0):
+        """ scaled values of the fields, None if the data is too short """
+        offset = start + self.offset
+        if len(data) < offset + self.layout.size:
+            return None
+
+        values = self.layout.unpack_from(data, offset)
+        return tuple(value*scale for value, scale in zip(values, self.scale))
+
+    def decode(self, data, start=0):
+        """ scaled values by field name, None if the data is too short """
+        values = self.unpack(data, start)
+        if values is None:
+            return None
+
+        return dict(zip(self.fields, values))
+
+# valve cap TPMS sensors: pressure in Pa (uint32) and temperature in
+# 0.01 C (int16), little endian at offset 18 of the advertising data
+VALVE_CAP = Decoder('valve_cap', "<Ih", ('pressure', 'temperature'),
+                    (0.00001, 0.01), 18)
+
+DECODERS = {VALVE_CAP.name: VALVE_CAP}
+
+def get_decoders(config):
+    """ built-in decoders and the ones declared in [Decoder.<name>] """
+    decoders = dict(DECODERS)
+
+    for section in config.sections():
+        if not section.startswith("Decoder."):
+            continue
+
+        name = section[len("Decoder."):]
+        try:
+            fields = [f.strip() for f in config[section]['fields'].split(',')]
+            scale = config[section].get('scale')
+            if scale:
+                scale = [float(s) for s in scale.split(',')]
+            decoders[name] = Decoder(name, config[section]['format'], fields,
+                                     scale, int(config[section].get('offset', '0'), 0))
+        except (KeyError, ValueError, struct.error) as err:
+            print("BLE: invalid decoder " + name + ": " + str(err))
+
+    return decoders
+
+class SensorRegistry:
+    """ Generic BLE sensors, fed by the BLE scan service """
+    def __init__(self, client):
+        self.client = client
+        self.service = None
+
+        self.by_mac = {}
+        self.by_manufacturer = {}
+        self.by_service_uuid = {}
+
+        # last published payload by sensor name
+        self.payload = {}
+
+    def add(self, name, decoder, mac=None, manufacturer=None, service_uuid=None):
+        """ add a sensor found by mac, manufacturer id or service UUID """
+        sensor = (name, decoder)
+        if mac:
+            self.by_mac[str_to_bdaddr(mac)] = sensor
+        elif manufacturer is not None:
+            self.by_manufacturer[manufacturer] = sensor
+        elif service_uuid is not None:
+            self.by_service_uuid[service_uuid] = sensor
+        else:
+            raise ValueError("sensor %s: no mac, manufacturer or service" % name)
+
+    def load(self, config, decoders):
+        """ add sensors declared in [Sensor.<name>] """
+        for section in config.sections():
+            if not section.startswith("Sensor."):
+                continue
+
+            name = section[len("Sensor."):]
+            conf = config[section]
+            try:
+                decoder = decoders[conf['decoder']]
+                manufacturer = conf.get('manufacturer')
+                service_uuid = conf.get('service')
+                self.add(name, decoder, mac=conf.get('mac'),
+                         manufacturer=int(manufacturer, 0) if manufacturer else None,
+                         service_uuid=int(service_uuid, 0) if service_uuid else None)
+            except (KeyError, ValueError) as err:
+                print("BLE: invalid sensor " + name + ": " + str(err))
+
+    def needs_all_adverts(self):
+        """ sensors without a mac must see adverts of any address """
+        return bool(self.by_manufacturer or self.by_service_uuid)
+
+    def handlers(self):
+        """ advertisement handlers by raw sensor address """
+        handlers = {}
+        for addr, sensor in self.by_mac.items():
+            handlers[addr] = self.mac_handler(addr, sensor)
+
+        return handlers
+
+    def mac_handler(self, addr, sensor):
+        name, decoder = sensor
+
+        def handle(data, rssi, timestamp):
+            self.publish(name, decoder, addr, data, 0, rssi, timestamp)
+
+        return handle
+
+    def subscribe(self, client):
+        """ no subscriptions """
+
+    def handle(self, addr, data, rssi, timestamp):
+        """ look up sensors of an advert by manufacturer id and service UUID """
+        for ad_type, start, end in iter_ad_structures(data):
+            if ad_type == AD_MANUFACTURER_SPECIFIC_DATA and end - start >= 2:
+                sensor = self.by_manufacturer.get(data[start] | data[start + 1] << 8)
+            elif ad_type == AD_SERVICE_DATA_16 and end - start >= 2:
+                sensor = self.by_service_uuid.get(data[start] | data[start + 1] << 8)
+            else:
+                continue
+
+            if sensor is not None:
+                self.publish(sensor[0], sensor[1], addr, data[:end], start + 2,
+                             rssi, timestamp)
+
+    def publish(self, name, decoder, addr, data, start, rssi, timestamp):
+        """ publish a reading when the sensor data has changed """
+        payload = data[start:]
+        if payload == self.payload.get(name):
+            return
+
+        values = decoder.decode(data, start)
+        if values is None:
+            return
+
+        self.payload[name] = bytes(payload)
+
+        reading = {'id': 'sensor',
+                   'name': name,
+                   'type': decoder.name,
+                   'mac': ':'.join('%02X' % b for b in reversed(addr)),
+                   'rssi': rssi,
+                   'time': timestamp,
+                   'values': values,
+                  }
+        if self.service is not None and self.service.adapter_rssi:
+            reading['adapters'] = self.service.adapter_rssi
+        self.client.publish("/motorhome/sensors/" + name, json.dumps(reading), retain=True)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+HCI capture recording and replay
+
+Captures are btsnoop files (HCI UART/H4 datalink, as written by btmon and
+read by Wireshark) of the LE advertising report events seen by the
+scanner. ReplaySocket feeds a capture or synthetic events through the
+normal LEAdvertisingScanner, no adapter or root needed.
+
+Record 1000 events of adapter hci0 (needs root):
+    hci_capture.py record capture.btsnoop -n 1000
+
+Print the reports of a capture:
+    hci_capture.py dump capture.btsnoop
+"""
+import sys
+import time
+import struct
+import socket
+import asyncio
+import argparse
+import threading
+import collections
+
+from bluetooth_utils import (LEAdvertisingScanner, open_le_scan_socket,
+                             enable_le_scan, disable_le_scan, toggle_device,
+                             iter_le_advertising_reports, raw_packet_to_str,
+                             str_to_bdaddr, SOL_HCI, HCI_CMSG_TSTAMP, TIMEVAL,
+                             LE_META_EVENT, EVT_LE_ADVERTISING_REPORT)
+
+BTSNOOP_MAGIC = b"btsnoop\0"
+BTSNOOP_VERSION = 1
+BTSNOOP_DATALINK_H4 = 1002
+BTSNOOP_HEADER = struct.Struct(">8sII")
+
+# original length, included length, flags, cumulative drops, timestamp
+BTSNOOP_RECORD = struct.Struct(">IIIIq")
+
+# received (controller to host) event
+BTSNOOP_FLAGS_EVENT = 0x03
+
+# microseconds from 0 AD to the unix epoch
+BTSNOOP_EPOCH_DELTA = 0x00dcddb30f2f8000
+
+HCI_EVENT_PKT = 0x04
+
+class BtsnoopWriter:
+    """ Write HCI event packets to a btsnoop file """
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(BTSNOOP_HEADER.pack(BTSNOOP_MAGIC, BTSNOOP_VERSION,
+                                            BTSNOOP_DATALINK_H4))
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, packet, timestamp):
+        """ append a packet (starting with the H4 packet type) """
+        ts = int(round(timestamp*1000000)) + BTSNOOP_EPOCH_DELTA
+        self.file.write(BTSNOOP_RECORD.pack(len(packet), len(packet),
+                                            BTSNOOP_FLAGS_EVENT, 0, ts))
+        self.file.write(packet)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+def read_btsnoop(path):
+    """ yield (timestamp, packet) of the HCI events in a btsnoop file """
+    with open(path, "rb") as f:
+        magic, version, datalink = BTSNOOP_HEADER.unpack(f.read(BTSNOOP_HEADER.size))
+        if magic != BTSNOOP_MAGIC or datalink != BTSNOOP_DATALINK_H4:
+            raise ValueError("%s: not a btsnoop H4 capture" % path)
+
+        while True:
+            header = f.read(BTSNOOP_RECORD.size)
+            if len(header) < BTSNOOP_RECORD.size:
+                return
+
+            _, length, flags, _, ts = BTSNOOP_RECORD.unpack(header)
+            packet = f.read(length)
+            if len(packet) < length:
+                return
+
+            if flags == BTSNOOP_FLAGS_EVENT and packet[0] == HCI_EVENT_PKT:
+                yield (ts - BTSNOOP_EPOCH_DELTA)/1000000, packet
+
+def le_advertising_event(reports):
+    """ HCI LE advertising report event of (mac, data, rssi) reports """
+    body = bytearray((EVT_LE_ADVERTISING_REPORT, len(reports)))
+    for mac, data, rssi in reports:
+        body += bytes((0x00, 0x00)) + str_to_bdaddr(mac) + bytes((len(data),))
+        body += data + struct.pack("b", rssi)
+
+    return bytes((HCI_EVENT_PKT, LE_META_EVENT, len(body))) + body
+
+def synthetic_tpms_events(macs, count, reports_per_event=1):
+    """
+    yield (None, packet) of count events with valve cap TPMS reports of
+    macs in turn, the pressure changes in every report
+    """
+    n = 0
+    for _ in range(count):
+        reports = []
+        for _ in range(reports_per_event):
+            # flags, manufacturer data with pressure and temperature at offset 18
+            data = (bytes((0x02, 0x01, 0x05, 0x17, 0xFF, 0x00, 0x01)) +
+                    bytes(10) + struct.pack("<Ih", 240000 + n % 10000, 2150) +
+                    bytes(4))
+            reports.append((macs[n % len(macs)], data, -60 - n % 30))
+            n += 1
+
+        yield None, le_advertising_event(reports)
+
+class ReplaySocket:
+    """
+    Socket-like source of HCI events for LEAdvertisingScanner.
+
+    A thread writes the packets to a socket pair, at rate packets/s or as
+    fast as the reader takes them. The kernel timestamp of each event is
+    its recorded one, or the time it was written when the timestamp is
+    None or restamp is set. Reading returns 0 bytes after the last event.
+    """
+    def __init__(self, packets, rate=None, restamp=False):
+        self._rsock, self._wsock = socket.socketpair(socket.AF_UNIX,
+                                                     socket.SOCK_SEQPACKET)
+        self._times = collections.deque()
+        self.sent = 0
+
+        self._thread = threading.Thread(target=self._feed,
+                                        args=(packets, rate, restamp),
+                                        daemon=True)
+        self._thread.start()
+
+    def _feed(self, packets, rate, restamp):
+        due = time.monotonic()
+        try:
+            for timestamp, packet in packets:
+                if rate:
+                    due += 1/rate
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                # timestamp is queued before the packet can be read
+                self._times.append(time.time() if restamp or timestamp is None
+                                   else timestamp)
+                self._wsock.send(packet)
+                self.sent += 1
+        except OSError:
+            # reader closed
+            pass
+        finally:
+            self._wsock.close()
+
+    def fileno(self):
+        return self._rsock.fileno()
+
+    def recvmsg_into(self, buffers, ancbufsize=0, flags=0):
+        nbytes = self._rsock.recv_into(buffers[0], 0, flags)
+        if nbytes == 0:
+            return 0, [], 0, None
+
+        timestamp = self._times.popleft()
+        ancdata = []
+        if ancbufsize:
+            sec = int(timestamp)
+            ancdata.append((SOL_HCI, HCI_CMSG_TSTAMP,
+                            TIMEVAL.pack(sec, int((timestamp - sec)*1000000))))
+
+        return nbytes, ancdata, 0, None
+
+    def close(self):
+        self._rsock.close()
+        self._thread.join()
+
+def record(path, count, dev_id=0):
+    """ write count LE advertising events of adapter dev_id to path """
+    import bluetooth._bluetooth as bluez
+
+    toggle_device(dev_id, True)
+    sock = bluez.hci_open_dev(dev_id)
+    enable_le_scan(sock, filter_duplicates=False)
+    hci_sock, old_filter = open_le_scan_socket(sock)
+
+    with BtsnoopWriter(path) as writer:
+        scanner = LEAdvertisingScanner(hci_sock, raw=True, recorder=writer.write)
+
+        async def capture():
+            async for _ in scanner:
+                if writer.count >= count:
+                    break
+
+        try:
+            asyncio.run(capture())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            scanner.close()
+            hci_sock.close()
+            sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, old_filter)
+            disable_le_scan(sock)
+
+        print("%d events written to %s" % (writer.count, path))
+
+def dump(path):
+    """ print the reports of a capture """
+    for timestamp, packet in read_btsnoop(path):
+        if packet[1] != LE_META_EVENT or packet[3] != EVT_LE_ADVERTISING_REPORT:
+            continue
+
+        for addr, adv_type, data, rssi, _ in iter_le_advertising_reports(memoryview(packet)):
+            mac = ':'.join('%02X' % b for b in reversed(addr))
+            print("%.6f %s adv_type=%02x rssi=%d %s" %
+                  (timestamp, mac, adv_type, rssi, raw_packet_to_str(data)))
+
+def main():
+    parser = argparse.ArgumentParser(description="HCI capture recording")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rec = commands.add_parser('record', help="record LE advertising events")
+    rec.add_argument('file')
+    rec.add_argument('-n', '--count', type=int, default=1000)
+    rec.add_argument('-d', '--dev', type=int, default=0)
+
+    dmp = commands.add_parser('dump', help="print the reports of a capture")
+    dmp.add_argument('file')
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args.file, args.count, args.dev)
+    else:
+        dump(args.file)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Ruuvitag sensor data
+
+Every tag is published retained on /motorhome/ruuvitag/<location>.
+"""
+import struct
+import configparser
+
+from bluetooth_utils import find_manufacturer_data, str_to_bdaddr
+
+RUUVI_COMPANY_ID = 0x0499
+
+# data format 3 (RAWv1): format, humidity, temperature (sign and integer
+# part, fraction), pressure, acceleration x/y/z, battery voltage
+RUUVI_RAWV1 = struct.Struct(">BBBBHhhhH")
+
+# data format 5 (RAWv2): format, temperature, humidity, pressure,
+# acceleration x/y/z, power info, movement counter, measurement sequence
+RUUVI_RAWV2 = struct.Struct(">BhHHhhhHBH")
+
+def decode_rawv1(data, offset):
+    """ decode data format 3 to temperature, humidity, pressure and battery """
+    (_, humidity, temp, temp_fraction, pressure,
+     _, _, _, battery) = RUUVI_RAWV1.unpack_from(data, offset)
+
+    temperature = (temp & 0x7F) + temp_fraction/100
+    if temp & 0x80:
+        temperature = -temperature
+
+    return temperature, humidity/2, (pressure + 50000)/100, battery
+
+def decode_rawv2(data, offset):
+    """ decode data format 5 to temperature, humidity, pressure and battery """
+    (_, temp, humidity, pressure,
+     _, _, _, power, _, _) = RUUVI_RAWV2.unpack_from(data, offset)
+
+    # all bits set (0x8000 for temperature) marks a value not available
+    temperature = temp*0.005 if temp != -32768 else None
+    humidity = humidity*0.0025 if humidity != 0xFFFF else None
+    pressure = (pressure + 50000)/100 if pressure != 0xFFFF else None
+    battery = (power >> 5) + 1600 if (power >> 5) != 0x7FF else None
+
+    return temperature, humidity, pressure, battery
+
+def get_ruuvitag_macs(conf_file):
+    """ Ruuvitag macs by location, the plain mac key is the outdoor tag """
+    config = configparser.ConfigParser()
+    macs = {}
+
+    try:
+        config.read(conf_file)
+        for location, mac in config['RuuviTag'].items():
+            if location == 'mac':
+                location = 'outdoor'
+            macs[location] = mac
+    except (configparser.Error, KeyError):
+        print("Ruuvitag: no sensors configured")
+
+    return macs
+
+class Ruuvitag:
+    """ Ruuvitag sensor, fed by the BLE scan service """
+    def __init__(self, client, mac, location, binary=False):
+        self.client = client
+        self.service = None
+        self.mac = mac
+        self.binary = binary
+
+        # last measurement, sequence number (format 5) or payload (format 3)
+        self.sequence = None
+        self.payload = b""
+
+        self.state = {'id': 'ruuvi',
+                      'location': location,
+                      'temperature': None,
+                      'humidity': None,
+                      'pressure': None,
+                      'battery': None,
+                     }
+
+    def handlers(self):
+        """ advertisement handlers by raw sensor address """
+        try:
+            return {str_to_bdaddr(self.mac): self.handle}
+        except (AttributeError, ValueError):
+            print("Ruuvitag: invalid mac for " + self.state['location'])
+            return {}
+
+    def subscribe(self, client):
+        """ no subscriptions """
+
+    def handle(self, data, rssi, timestamp):
+        """ decode and publish new measurements of the sensor """
+        offset, end = find_manufacturer_data(data, RUUVI_COMPANY_ID)
+        if offset < 0:
+            return
+
+        data_format = data[offset]
+        if data_format == 5 and end - offset >= RUUVI_RAWV2.size:
+            # measurement sequence is the last field of the layout
+            sequence = data[offset + RUUVI_RAWV2.size - 2] << 8 | data[offset + RUUVI_RAWV2.size - 1]
+            if sequence == self.sequence:
+                return
+            self.sequence = sequence
+            values = decode_rawv2(data, offset)
+        elif data_format == 3 and end - offset >= RUUVI_RAWV1.size:
+            payload = data[offset:offset + RUUVI_RAWV1.size]
+            if payload == self.payload:
+                return
+            self.payload = bytes(payload)
+            values = decode_rawv1(data, offset)
+        else:
+            return
+
+        (self.state['temperature'], self.state['humidity'],
+         self.state['pressure'], self.state['battery']) = values
+
+        self.client.publish_state("/motorhome/ruuvitag/" + self.state['location'],
+                                  self.state, self.binary)
@@ -0,0 +1,135 @@
+"""
+BLE scan duty cycle scheduler
+
+The Pi 3B+ bluetooth and WiFi radios share one antenna, scanning takes
+air time from the Virb preview stream. The scheduler picks the scan
+interval and window from the vehicle state on the bus:
+
+ * driving: scan continuously, tire pressure is needed now
+ * parked:  short scan window every few seconds
+ * preview: dashcam live preview open, leave gaps for WiFi
+
+Interval and window are in units of 0.625 ms.
+"""
+import time
+import json
+
+from mqtt_payload import decode
+
+# (interval, window) of the scan profiles
+SCAN_PROFILES = {'driving': (0x0100, 0x0100),   # 160 ms / 160 ms, 100 %
+                 'parked': (0x2000, 0x0100),    # 5.12 s / 160 ms, 3 %
+                 'preview': (0x0800, 0x0100),   # 1.28 s / 160 ms, 12.5 %
+                }
+
+# speed (gps units) above which the vehicle is moving
+DRIVING_SPEED = 2.0
+
+# seconds below DRIVING_SPEED before the vehicle is parked
+PARKED_DELAY = 120
+
+class ScanScheduler:
+    """ Set BLE scan parameters by vehicle state, fed by the BLE scan service """
+    def __init__(self, client):
+        self.client = client
+        self.service = None
+
+        self.moving_time = time.monotonic()
+        self.driving = True
+        self.preview = False
+        self.profile = None
+
+        # packets, seconds and preview fps samples per profile since last report
+        self.profile_start = time.monotonic()
+        self.profile_packets = 0
+        self.stats = {name: [0, 0.0, 0.0, 0] for name in SCAN_PROFILES}
+
+    def handlers(self):
+        """ no sensors """
+        return {}
+
+    def subscribe(self, client):
+        client.message_callback_add("/motorhome/gps", self.on_gps)
+        client.message_callback_add("/motorhome/dashcam", self.on_dashcam)
+        client.subscribe("/motorhome/gps")
+        client.subscribe("/motorhome/dashcam")
+
+    def on_gps(self, client, userdata, message):
+        try:
+            speed = float(decode(message.payload)['speed'])
+        except (ValueError, KeyError, TypeError):
+            return
+
+        now = time.monotonic()
+        if speed > DRIVING_SPEED:
+            self.moving_time = now
+            self.driving = True
+        elif now - self.moving_time > PARKED_DELAY:
+            self.driving = False
+
+        self.schedule()
+
+    def on_dashcam(self, client, userdata, message):
+        try:
+            data = json.loads(message.payload)
+        except ValueError:
+            return
+
+        self.preview = bool(data.get('preview'))
+        self.schedule()
+
+        fps = data.get('fps')
+        if self.preview and fps is not None:
+            stats = self.stats[self.profile]
+            stats[2] += fps
+            stats[3] += 1
+
+    def schedule(self):
+        """ switch to the profile of the current vehicle state """
+        if self.preview:
+            profile = 'preview'
+        elif self.driving:
+            profile = 'driving'
+        else:
+            profile = 'parked'
+
+        if profile == self.profile:
+            return
+
+        self.account()
+        self.profile = profile
+        print("BLE: scan profile " + profile)
+        self.service.set_scan_params(*SCAN_PROFILES[profile])
+
+    def account(self):
+        """ add packets and time since the last switch to the current profile """
+        now = time.monotonic()
+        packets = self.service.packets_total()
+
+        if self.profile is not None:
+            stats = self.stats[self.profile]
+            stats[0] += packets - self.profile_packets
+            stats[1] += now - self.profile_start
+
+        self.profile_start = now
+        self.profile_packets = packets
+
+    def report(self):
+        """ print and publish packet rate and preview fps of each profile """
+        self.account()
+
+        report = {'id': 'blescan', 'profile': self.profile}
+        for name, (packets, seconds, fps, samples) in self.stats.items():
+            if seconds == 0:
+                continue
+
+            report[name] = {'seconds': round(seconds),
+                            'packets_per_s': round(packets/seconds, 1),
+                            'preview_fps': round(fps/samples, 1) if samples else None,
+                           }
+            print("BLE: %s %.0f s, %.1f packets/s, preview %s fps" %
+                  (name, seconds, packets/seconds,
+                   "%.1f" % (fps/samples) if samples else "-"))
+
+        self.stats = {name: [0, 0.0, 0.0, 0] for name in SCAN_PROFILES}
+        self.client.publish("/motorhome/ble/scan", json.dumps(report))
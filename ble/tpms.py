@@ -0,0 +1,336 @@
+"""
+TPMS for motorhome infotainment
+
+All tires are published in one retained frame on /motorhome/tpms:
+
+{"id": "tpms", "time": 1700000000.0, "warn": 0,
+ "tires": [["FL", 2.45, 21.5, 0, 0.002], ["FR", 2.5, 22.0, 0, null], ...]}
+
+with position, pressure (bar), temperature (C), warn and leak rate
+(bar/h, null until known) of the tires heard from. Warn is 1 for low
+pressure and 2 for a leak: the temperature compensated pressure has
+dropped faster than leak_rate over the last leak_window seconds.
+
+Pressure is smoothed with an exponential filter of time constant
+filter_time seconds. Low pressure warn turns on at the season's warn
+pressure and off hysteresis bar above it, a warn changes only after the
+new state has held for warn_dwell seconds.
+
+A frame is sent when a pressure or temperature moves past its deadband, a
+warn changes or max_age seconds have passed, checked by a timer of the
+scan service so the frames go on without adverts. Tires not heard from
+for max_age seconds are left out, and shown stale by the GUI. Set in
+motorhome.conf:
+
+[TPMS]
+pressure_deadband = 0.05
+temperature_deadband = 1.0
+max_age = 60
+leak_rate = 0.1
+leak_window = 3600
+filter_time = 10
+hysteresis = 0.1
+warn_dwell = 10
+"""
+import configparser
+import math
+from pathlib import Path
+
+from bluetooth_utils import str_to_bdaddr
+from decoders import VALVE_CAP
+from mqtt_payload import get_binary_topics
+from trend import PressureTrend
+
+season = 0
+
+# positions without a [TirePositions] section, and their mac keys
+DEFAULT_POSITIONS = ('FL', 'FR', 'RL', 'RR', 'Spear')
+LEGACY_KEYS = {'FL': 'frontLeft',
+               'FR': 'frontRight',
+               'RL': 'rearLeft',
+               'RR': 'rearRight',
+               'Spear': 'spear',
+              }
+
+# defaults of the [TPMS] section
+PRESSURE_DEADBAND = 0.05
+TEMPERATURE_DEADBAND = 1.0
+MAX_AGE = 60
+LEAK_RATE = 0.1
+LEAK_WINDOW = 3600
+FILTER_TIME = 10
+HYSTERESIS = 0.1
+WARN_DWELL = 10
+
+# seconds between trend samples
+LEAK_INTERVAL = 30
+
+WARN_PRESSURE = 1
+WARN_LEAK = 2
+
+def get_tire_positions(conf_file):
+    """ tire position names of [TirePositions], see tires.py of the GUI """
+    config = configparser.ConfigParser()
+    config.optionxform = str
+
+    try:
+        config.read(conf_file)
+        positions = list(config['TirePositions'])
+    except (configparser.Error, KeyError):
+        positions = []
+
+    return positions or list(DEFAULT_POSITIONS)
+
+def build_tire_index(tires, season):
+    """ map raw sensor addresses of the given season to tires """
+    index = {}
+    for tire in tires:
+        try:
+            index[str_to_bdaddr(tire.mac[season])] = tire
+        except (IndexError, ValueError, AttributeError):
+            print("TPMS: no sensor for tire " + tire.name)
+
+    return index
+
+def update_season(self, season):
+    """ set tire season summer/winter """
+    if season:
+        self.season = "TPMS_winter"
+    else:
+        self.season = "TPMS_summer"
+
+    print("TPMS: " + self.season)
+
+class Tire:
+    """ Tire class """
+    def __init__(self, tire, decoders):
+        global season
+        self.name = tire
+        # receive time of the last data, from the scanner
+        self.timestamp = 0.0
+        self.mac = []
+        self.tpms_warn = 0
+        self.pressure = math.nan
+        self.temperature = math.nan
+
+        # vehicle the tire reports to
+        self.vehicle = None
+        self.trend = None
+
+        self.filter_time = FILTER_TIME
+        self.hysteresis = HYSTERESIS
+        self.warn_dwell = WARN_DWELL
+        # time the pending warn state was first seen, None if no change
+        self.warn_since = None
+
+        # sensor decoder of summer and winter tires
+        self.decoders = [VALVE_CAP, VALVE_CAP]
+        self.decoder = VALVE_CAP
+
+        conf_file = str(Path.home()) + "/.motorhome/motorhome.conf"
+        config = configparser.ConfigParser()
+
+        # no low pressure warning without a valid config
+        self.warn_pressure = 0.0
+
+        try:
+            config.read(conf_file)
+            season_str = "TPMS_" + config['Season']['season']
+            self.warn_pressure = float(config[season_str]['warn'])
+
+            if season_str == "TPMS_summer":
+                season = 0
+            else:
+                season = 1
+        except KeyError as err:
+            print("TPMS: " + str(err) + " missing in conf file for tire " + tire)
+        except ValueError as err:
+            print("TPMS: invalid warn pressure for tire " + tire + ": " + str(err))
+        except (configparser.Error, IOError, OSError) as __err:
+            print("TPMS: unable to read conf file for tire " + tire)
+
+        for i, section in enumerate(('TPMS_summer', 'TPMS_winter')):
+            if not config.has_section(section):
+                print("TPMS: [" + section + "] missing in conf file for tire " + tire)
+                self.mac.append(None)
+                continue
+
+            # mac by position name, or by the old key of the five positions
+            self.mac.append(config[section].get(tire) or
+                            config[section].get(LEGACY_KEYS.get(tire, tire)))
+
+            sensor = config[section].get('sensor', VALVE_CAP.name)
+            try:
+                self.decoders[i] = decoders[sensor]
+            except KeyError:
+                print("TPMS: unknown sensor " + sensor + " for tire " + tire)
+
+    def handle(self, data, rssi, timestamp):
+        """ handle advertisement of the tire sensor """
+        values = self.decoder.unpack(data)
+        if values is None:
+            return
+
+        pressure, self.temperature = values
+        self.trend.add(timestamp, pressure, self.temperature)
+
+        # exponential filter, restarted after a long silence
+        dt = timestamp - self.timestamp
+        if dt > 10*self.filter_time or math.isnan(self.pressure):
+            self.pressure = pressure
+        elif dt > 0:
+            self.pressure += (pressure - self.pressure)*dt/(self.filter_time + dt)
+        self.timestamp = timestamp
+
+        self.update_warn(timestamp)
+        self.vehicle.update(self, timestamp)
+
+    def update_warn(self, timestamp):
+        """ change warn when the new state has held for warn_dwell """
+        warn = self.check_pressure(self.pressure)
+        if not warn and self.trend.leaking():
+            warn = WARN_LEAK
+
+        if warn == self.tpms_warn:
+            self.warn_since = None
+        elif self.warn_since is None:
+            self.warn_since = timestamp
+        elif timestamp - self.warn_since >= self.warn_dwell:
+            self.tpms_warn = warn
+            self.warn_since = None
+
+    def set_timestamp(self, timestamp):
+        """ set timestamp of last received tpms data """
+        self.timestamp = timestamp
+
+    def check_pressure(self, pressure):
+        """ check pressure agains TPMS warn level, with hysteresis """
+
+        if pressure <= self.warn_pressure:
+            return WARN_PRESSURE
+
+        if self.tpms_warn == WARN_PRESSURE and pressure < self.warn_pressure + self.hysteresis:
+            return WARN_PRESSURE
+
+        return 0
+
+class TPMS:
+    """ TPMS sensors, fed by the BLE scan service """
+    def __init__(self, client, decoders):
+        self.client = client
+        self.service = None
+        conf_file = str(Path.home()) + "/.motorhome/motorhome.conf"
+        self.tires = [Tire(name, decoders) for name in get_tire_positions(conf_file)]
+
+        # season of the config file, read by Tire
+        self.season = season
+        print("tpms: " + str(self.season))
+
+        self.pressure_deadband = PRESSURE_DEADBAND
+        self.temperature_deadband = TEMPERATURE_DEADBAND
+        self.max_age = MAX_AGE
+        leak_rate = LEAK_RATE
+        leak_window = LEAK_WINDOW
+        filter_time = FILTER_TIME
+        hysteresis = HYSTERESIS
+        warn_dwell = WARN_DWELL
+
+        config = configparser.ConfigParser()
+        config.read(conf_file)
+        try:
+            self.pressure_deadband = config.getfloat('TPMS', 'pressure_deadband', fallback=PRESSURE_DEADBAND)
+            self.temperature_deadband = config.getfloat('TPMS', 'temperature_deadband', fallback=TEMPERATURE_DEADBAND)
+            self.max_age = config.getfloat('TPMS', 'max_age', fallback=MAX_AGE)
+            leak_rate = config.getfloat('TPMS', 'leak_rate', fallback=LEAK_RATE)
+            leak_window = config.getfloat('TPMS', 'leak_window', fallback=LEAK_WINDOW)
+            filter_time = config.getfloat('TPMS', 'filter_time', fallback=FILTER_TIME)
+            hysteresis = config.getfloat('TPMS', 'hysteresis', fallback=HYSTERESIS)
+            warn_dwell = config.getfloat('TPMS', 'warn_dwell', fallback=WARN_DWELL)
+        except ValueError as err:
+            print("TPMS: invalid value in [TPMS]: " + str(err))
+
+        for tire in self.tires:
+            tire.vehicle = self
+            tire.trend = PressureTrend(leak_window, LEAK_INTERVAL, leak_rate)
+            tire.filter_time = filter_time
+            tire.hysteresis = hysteresis
+            tire.warn_dwell = warn_dwell
+
+        # pressure, temperature and warn of each tire in the last frame
+        self.published = {}
+        self.publish_time = 0.0
+        self.warn = 0
+        self.binary = 'tpms' in get_binary_topics(conf_file)
+
+    def update(self, tire, timestamp):
+        """ publish a frame if tire moved past a deadband """
+        last = self.published.get(tire.name)
+        if (last is not None and
+                abs(tire.pressure - last[0]) < self.pressure_deadband and
+                abs(tire.temperature - last[1]) < self.temperature_deadband and
+                tire.tpms_warn == last[2]):
+            return
+
+        self.publish_frame(timestamp)
+
+    def heartbeat(self, now):
+        """ publish a frame if the last is old or has a tire gone silent """
+        if not self.published:
+            return
+
+        if (now - self.publish_time >= self.max_age or
+                any(now - tire.timestamp > self.max_age
+                    for tire in self.tires if tire.name in self.published)):
+            self.publish_frame(now)
+
+    def publish_frame(self, timestamp):
+        """ publish the values of all tires heard from within max_age """
+        tires = []
+        self.published = {}
+        for tire in self.tires:
+            if math.isnan(tire.pressure) or timestamp - tire.timestamp > self.max_age:
+                continue
+            leak = tire.trend.rate
+            tires.append((tire.name, round(tire.pressure, 3),
+                          round(tire.temperature, 1), tire.tpms_warn,
+                          None if math.isnan(leak) else round(leak, 3)))
+            self.published[tire.name] = (tire.pressure, tire.temperature, tire.tpms_warn)
+
+        warn = int(any(tire[3] for tire in tires))
+        if warn != self.warn:
+            self.warn = warn
+            self.client.publish("/motorhome/tpms_warn", warn, retain=True)
+
+        frame = {'id': 'tpms', 'time': timestamp, 'warn': warn, 'tires': tires}
+        self.client.publish_state("/motorhome/tpms", frame, self.binary)
+        self.publish_time = timestamp
+
+    def handlers(self):
+        """ advertisement handlers by raw sensor address """
+        index = build_tire_index(self.tires, self.season)
+        for tire in self.tires:
+            tire.decoder = tire.decoders[self.season]
+
+        return {addr: tire.handle for addr, tire in index.items()}
+
+    def subscribe(self, client):
+        """ subscribe to season changes """
+        client.message_callback_add("/motorhome/tpms/season", self.get_season)
+        client.subscribe("/motorhome/tpms/season")
+
+    def get_season(self, client, userdata, message):
+        """ switch sensors between summer and winter tires """
+        try:
+            self.season = int(message.payload.decode("utf-8", "ignore"))
+        except ValueError:
+            print("TPMS: invalid season " + str(message.payload))
+            return
+
+        print("season: " + str(self.season))
+
+        # other set of tires
+        for tire in self.tires:
+            tire.trend.reset()
+
+        if self.service is not None:
+            self.service.update()
@@ -0,0 +1,115 @@
+"""
+Tire pressure trend for leak detection
+
+Least squares slope of the temperature compensated pressure over a
+sliding window. Samples are taken at most every interval seconds into a
+preallocated ring buffer, the regression sums are updated with the new
+and the dropped sample only.
+"""
+import math
+from array import array
+
+# gauge pressure plus atmosphere is absolute pressure (bar)
+ATMOSPHERE = 1.01325
+
+# reference temperature of the compensated pressure (C)
+REFERENCE_TEMPERATURE = 20.0
+
+ZERO_CELSIUS = 273.15
+
+def compensate(pressure, temperature):
+    """ gauge pressure at the reference temperature, constant volume """
+    return ((pressure + ATMOSPHERE)*(REFERENCE_TEMPERATURE + ZERO_CELSIUS)/
+            (temperature + ZERO_CELSIUS) - ATMOSPHERE)
+
+class PressureTrend:
+    """ Pressure loss rate of a tire """
+    def __init__(self, window=3600, interval=30, limit=0.1):
+        self.interval = interval
+        # leak rate (bar/h) of the early warning
+        self.limit = limit
+
+        self.size = max(2, int(window/interval))
+        self.times = array('d', bytes(8*self.size))
+        self.pressures = array('d', bytes(8*self.size))
+        self.reset()
+
+    def reset(self):
+        """ forget all samples, e.g. when the tire has been changed """
+        self.count = 0
+        self.next = 0
+        self.origin = None
+        self.last = -math.inf
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+        # pressure loss in bar/h, nan until half the window is sampled
+        self.rate = math.nan
+        self.leak = False
+
+    def add(self, timestamp, pressure, temperature):
+        """ add a measurement, returns True if it was sampled """
+        if timestamp - self.last < self.interval:
+            return False
+        self.last = timestamp
+
+        if self.origin is None:
+            self.origin = timestamp
+
+        x = timestamp - self.origin
+        y = compensate(pressure, temperature)
+        i = self.next
+
+        if self.count == self.size:
+            old_x = self.times[i]
+            old_y = self.pressures[i]
+            self.sx -= old_x
+            self.sy -= old_y
+            self.sxx -= old_x*old_x
+            self.sxy -= old_x*old_y
+        else:
+            self.count += 1
+
+        self.times[i] = x
+        self.pressures[i] = y
+        self.sx += x
+        self.sy += y
+        self.sxx += x*x
+        self.sxy += x*y
+
+        self.next = i + 1
+        if self.next == self.size:
+            self.next = 0
+            self.rebase()
+
+        if 2*self.count >= self.size:
+            n = self.count
+            d = n*self.sxx - self.sx*self.sx
+            if d > 0:
+                # slope in bar/s, loss is positive
+                self.rate = -(n*self.sxy - self.sx*self.sy)/d*3600
+
+        return True
+
+    def rebase(self):
+        """ move the time origin to the oldest sample, drop rounding drift """
+        shift = self.times[0]
+        self.origin += shift
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        for i in range(self.count):
+            x = self.times[i] - shift
+            y = self.pressures[i]
+            self.times[i] = x
+            self.sx += x
+            self.sy += y
+            self.sxx += x*x
+            self.sxy += x*y
+
+    def leaking(self):
+        """ pressure drops faster than the limit, until it is below half of it """
+        if self.rate > self.limit:
+            self.leak = True
+        elif not self.rate >= self.limit/2:
+            # below half the limit or unknown
+            self.leak = False
+
+        return self.leak
@@ -2,11 +2,17 @@
 Garmin Virb camcorder
 """
 import os
+import time
+import json
 import cv2
 
 from PyQt5.QtCore import pyqtSignal, QObject
 from PyQt5.QtGui import QPixmap, QImage
 from virb import Virb
+from mqtt_publisher import Publisher
+
+# interval of the preview frame rate report in seconds
+FPS_INTERVAL = 5
 
 class Preview(QObject):
     """ Garmin Virb camcorder """
@@ -21,6 +27,14 @@ class Preview(QObject):
 
         self.run_video = True
 
+        # preview state for the BLE scan scheduler
+        self.client = Publisher("Dashcam")
+
+    def publish_state(self, preview, fps=None):
+        """ publish preview state and measured frame rate """
+        state = {'id': 'dashcam', 'preview': preview, 'fps': fps}
+        self.client.publish("/motorhome/dashcam", json.dumps(state))
+
     def live_preview(self):
         """ Show live preview """
         print("setting up camera")
@@ -40,16 +54,31 @@ class Preview(QObject):
         fps = float(cap.get(cv2.CAP_PROP_FPS))
         print("video: " + str(width) + "x" + str(height) + "@" + str(fps))
 
+        self.client.start()
+        self.publish_state(True)
+
+        frames = 0
+        fps_time = time.monotonic()
+
         while self.run_video:
             ret, frame = cap.read()
             if ret:
+                frames += 1
                 frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 image = QImage(frame, frame.shape[1], frame.shape[0], QImage.Format_RGB888)
                 pixmap = QPixmap.fromImage(image)
                 self.image.emit(pixmap)
 
+            now = time.monotonic()
+            if now - fps_time >= FPS_INTERVAL:
+                self.publish_state(True, round(frames/(now - fps_time), 1))
+                frames = 0
+                fps_time = now
+
         print("video preview stopped")
         cap.release()
+        self.publish_state(False)
+        self.client.stop()
         self.preview_finished.emit()
 
     def stop_preview(self):
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+MQTT flight recorder and replay
+
+The recorder (flight_recorder.service) keeps every /motorhome/# message
+of the last MAX_SIZE bytes in memory, and writes them to a log file in
+~/.motorhome/recordings on demand or POST_ALERT seconds after an alert,
+a non-zero /motorhome/tpms_warn. Set in motorhome.conf:
+
+[Recorder]
+max_size = 8
+directory = /home/pi/.motorhome/recordings
+
+max_size is in MB. A dump is requested with a message on
+/motorhome/recorder/dump or with SIGUSR1:
+
+    systemctl kill -s USR1 flight_recorder
+
+Logs are gzip compressed, a header and a record per message:
+
+    header  magic, version
+    record  time, topic length, payload length, topic, payload
+
+Replay republishes a log with its timing, N times faster, or as fast as
+possible, to drive the GUI and the windows with real traffic. State
+topics are written to the "replay" live state segment too, if
+[LiveState] is enabled. Messages are replayed not retained, and
+/motorhome/tpms_warn and /motorhome/recorder/# are left out, so a
+running recorder does not take the replay for live alerts.
+
+    flight_recorder.py replay drive.mhlog.gz --speed 10
+    flight_recorder.py replay drive.mhlog.gz --fast
+    flight_recorder.py dump drive.mhlog.gz
+"""
+import os
+import sys
+import gzip
+import time
+import signal
+import struct
+import argparse
+import threading
+import configparser
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from mqtt_payload import decode
+from mqtt_publisher import Publisher
+from live_state import get_state_dir
+
+CONF_FILE = str(Path.home()) + "/.motorhome/motorhome.conf"
+
+MAGIC = b"MHFR"
+VERSION = 1
+LOG_HEADER = struct.Struct("<4sH")
+
+# time, topic length, payload length
+RECORD = struct.Struct("<dHI")
+
+MAX_SIZE = 8
+RECORDINGS_DIR = str(Path.home()) + "/.motorhome/recordings"
+
+# seconds recorded after an alert before the dump
+POST_ALERT = 30
+
+RECORDER_TOPIC = "/motorhome/recorder/"
+DUMP_TOPIC = RECORDER_TOPIC + "dump"
+ALERT_TOPIC = "/motorhome/tpms_warn"
+
+# topics the GUI reads from the live state segments
+STATE_TOPICS = ("/motorhome/tpms", "/motorhome/gps")
+RUUVI_TOPIC = "/motorhome/ruuvitag/"
+
+def get_recorder_config(conf_file):
+    """ buffer size in bytes and directory of the logs """
+    config = configparser.ConfigParser()
+
+    try:
+        config.read(conf_file)
+        return (int(config.getfloat('Recorder', 'max_size', fallback=MAX_SIZE)*1024*1024),
+                config.get('Recorder', 'directory', fallback=RECORDINGS_DIR))
+    except (configparser.Error, ValueError) as err:
+        print("flight recorder: invalid [Recorder]: " + str(err))
+        return MAX_SIZE*1024*1024, RECORDINGS_DIR
+
+def write_log(path, records):
+    """ write (time, topic, payload) records to a log file """
+    with gzip.open(path + ".tmp", 'wb') as f:
+        f.write(LOG_HEADER.pack(MAGIC, VERSION))
+        for timestamp, topic, payload in records:
+            topic = topic.encode()
+            f.write(RECORD.pack(timestamp, len(topic), len(payload)))
+            f.write(topic)
+            f.write(payload)
+    os.replace(path + ".tmp", path)
+
+def read_log(path):
+    """ yield (time, topic, payload) of the records of a log file """
+    with gzip.open(path, 'rb') as f:
+        magic, version = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s: not a flight recorder log" % path)
+
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+
+            timestamp, topic_length, length = RECORD.unpack(header)
+            topic = f.read(topic_length)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+
+            yield timestamp, topic.decode(), payload
+
+class FlightRecorder:
+    """ Messages of the last max_size bytes """
+    def __init__(self, max_size, directory):
+        self.max_size = max_size
+        self.directory = directory
+        self.records = deque()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        # time of the pending dump and its reason
+        self.dump_time = None
+        self.reason = None
+
+    def on_message(self, client, userdata, message):
+        if message.topic.startswith(RECORDER_TOPIC):
+            if message.topic == DUMP_TOPIC:
+                self.request_dump("request")
+            return
+
+        with self.lock:
+            self.records.append((time.time(), message.topic, message.payload))
+            self.size += len(message.topic) + len(message.payload) + RECORD.size
+            while self.size > self.max_size:
+                _, topic, payload = self.records.popleft()
+                self.size -= len(topic) + len(payload) + RECORD.size
+
+    def on_tpms_warn(self, client, userdata, message):
+        try:
+            warn = decode(message.payload)
+        except ValueError:
+            return
+        if warn and not message.retain:
+            self.request_dump("alert", POST_ALERT)
+
+    def request_dump(self, reason, delay=0):
+        """ dump after delay seconds, or a pending dump if it is sooner """
+        dump_time = time.monotonic() + delay
+        if self.dump_time is None or dump_time < self.dump_time:
+            print("flight recorder: " + reason + ", dump in %d s" % delay)
+            self.reason = reason
+            self.dump_time = dump_time
+
+    def dump_due(self):
+        return self.dump_time is not None and time.monotonic() >= self.dump_time
+
+    def dump(self):
+        """ write the buffer to a new log file, its path or None """
+        with self.lock:
+            records = list(self.records)
+        reason = self.reason
+        self.dump_time = None
+
+        path = os.path.join(self.directory, datetime.now().strftime("%Y%m%d-%H%M%S-") +
+                            reason + ".mhlog.gz")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_log(path, records)
+        except OSError as err:
+            print("flight recorder: unable to write log: " + str(err))
+            return None
+
+        print("flight recorder: %d messages written to %s" % (len(records), path))
+        return path
+
+def record(conf_file):
+    """ run the recorder until SIGINT or SIGTERM """
+    max_size, directory = get_recorder_config(conf_file)
+    recorder = FlightRecorder(max_size, directory)
+
+    running = True
+
+    def stop(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: recorder.request_dump("request"))
+
+    client = Publisher("recorder")
+    client.message_callback_add("/motorhome/#", recorder.on_message)
+    client.message_callback_add(ALERT_TOPIC, recorder.on_tpms_warn)
+    client.subscribe("/motorhome/#")
+    client.start()
+
+    print("flight recorder: recording %.1f MB" % (max_size/1024/1024))
+    while running:
+        if recorder.dump_due():
+            path = recorder.dump()
+            if path is not None:
+                client.publish(RECORDER_TOPIC + "log", path)
+        time.sleep(0.5)
+
+    # an alert is not lost with a restart
+    if recorder.dump_time is not None:
+        recorder.dump()
+    client.stop()
+
+def replay(path, speed, conf_file, broker):
+    """ republish a log, speed times faster than recorded, None for no delay """
+    client = Publisher("replay", broker, state_dir=get_state_dir(conf_file))
+    client.start()
+    time.sleep(1)
+
+    count = 0
+    skipped = 0
+    start = time.monotonic()
+    first = None
+    try:
+        for timestamp, topic, payload in read_log(path):
+            # alerts and recorder requests would be taken as live ones
+            if topic == ALERT_TOPIC or topic.startswith(RECORDER_TOPIC):
+                skipped += 1
+                continue
+
+            if first is None:
+                first = timestamp
+            if speed:
+                delay = start + (timestamp - first)/speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            client.publish(topic, payload)
+            if client.state is not None and (topic in STATE_TOPICS or
+                                             topic.startswith(RUUVI_TOPIC)):
+                client.state.write(topic, payload)
+            count += 1
+    except KeyboardInterrupt:
+        pass
+
+    elapsed = time.monotonic() - start
+    client.stop()
+    if client.state is not None:
+        client.state.close()
+
+    print("%d messages replayed in %.1f s, %.0f messages/s, %d dropped, %d left out" %
+          (count, elapsed, count/max(elapsed, 1e-6), client.dropped, skipped))
+
+def dump(path):
+    """ print the records of a log """
+    first = None
+    for timestamp, topic, payload in read_log(path):
+        if first is None:
+            first = timestamp
+        try:
+            message = decode(payload)
+        except ValueError:
+            message = payload
+        print("%10.3f %s %s" % (timestamp - first, topic, message))
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT flight recorder")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('record', help="record /motorhome/# until stopped")
+
+    rep = commands.add_parser('replay', help="republish a log")
+    rep.add_argument('file')
+    rep.add_argument('-s', '--speed', type=float, default=1.0,
+                     help="times faster than recorded")
+    rep.add_argument('--fast', action='store_true', help="as fast as possible")
+    rep.add_argument('--broker', default='localhost')
+
+    dmp = commands.add_parser('dump', help="print the messages of a log")
+    dmp.add_argument('file')
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(CONF_FILE)
+    elif args.command == 'replay':
+        replay(args.file, None if args.fast else args.speed, CONF_FILE, args.broker)
+    else:
+        dump(args.file)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,22 +2,36 @@
 
 # WS server that sends dasboard data
 
+import sys
 import subprocess
-import configparser
+import json
 import time
 import math
-import json
 import signal
-import paho.mqtt.client as mqtt
 
 from datetime import datetime, timedelta
 from pathlib import Path
-from gps3.agps3threaded import AGPS3mechanism
+
+# mqtt_payload, mqtt_publisher and live_state are shared with the GUI
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
 from virb import Virb
-from searchvirb import ping_ok
+from gpsd_client import GpsdClient, fix_time
+from mqtt_payload import get_binary_topics
+from mqtt_publisher import Publisher
+from live_state import get_state_dir
+from virb_discovery import VirbDiscovery
 
 running = True
 
+# without an internal fix for VIRB_TIMEOUT seconds, the Virb position is
+# published every VIRB_INTERVAL seconds
+VIRB_TIMEOUT = 2
+VIRB_INTERVAL = 1
+
+# fix latency published on /motorhome/gps_latency every STATS_INTERVAL seconds
+STATS_INTERVAL = 60
+
 # trap ctrl-c, SIGINT and come down nicely
 def signal_handler(signal, frame):
     global running
@@ -27,24 +41,6 @@ def signal_handler(signal, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
-def search_virb():
-
-    conf_file = str(Path.home()) + "/.motorhome/network.conf"
-    config = configparser.ConfigParser()
-    config.read(conf_file)
-
-    ssid = subprocess.check_output(['sudo', 'iwgetid']).decode("utf-8").split('"')[1]
-
-    try:
-        ip = config[ssid]['ip']
-    except Exception as e:
-        return ""
-
-    if not ping_ok(ip):
-        return ""
-
-    return ip
-
 def update_datetime(date, update):
     """ update date and time for system clock """
     if date == "n/a" or update:
@@ -61,28 +57,19 @@ def update_datetime(date, update):
 
     return True
 
-# The callback for when the client receives a CONNACK response from the MQTT server.
-def on_connect(client, userdata, flags, rc):
-    print("Connected to MQTT broker with result code "+str(rc))
-
-    # Subscribing in on_connect() means that if we lose the connection and
-    # reconnect then subscriptions will be renewed.
-    client.subscribe("$SYS/#")
-
 def run_dash_server():
     global running
-    mode = 0
 
-    gps_thread = AGPS3mechanism()
-    gps_thread.stream_data()
-    gps_thread.run_thread()
+    gpsd = GpsdClient()
+    discovery = VirbDiscovery(str(Path.home()) + "/.motorhome/network.conf")
+    discovery.start()
 
     print("running dash server")
 
-    mqttBroker = 'localhost'
-    client = mqtt.Client("GPS")
-    client.on_connect = on_connect
-    client.connect(mqttBroker)
+    conf_file = str(Path.home()) + "/.motorhome/motorhome.conf"
+    binary = 'gps' in get_binary_topics(conf_file)
+    client = Publisher("GPS", state_dir=get_state_dir(conf_file))
+    client.start()
 
     virb_initialized = False
     time_updated = False
@@ -97,34 +84,57 @@ def run_dash_server():
          'src': "internal",
         }
 
+    # time of the last published TPV, gpsd may repeat a fix
+    last_fix = None
+    internal_time = 0.0
+    virb_time = 0.0
+
+    fixes = 0
+    duplicates = 0
+    latency_sum = 0.0
+    latency_max = 0.0
+    age_sum = 0.0
+    stats_time = time.monotonic()
+
     while running:
-        try:
-            time_updated = update_datetime(gps_thread.data_stream.time,
-                                           time_updated)
-        except:
-            pass
-
-        try:
-            mode = int(gps_thread.data_stream.mode)
-        except ValueError:
-            print("dash server: Value not defined for GPS mode")
-            mode = 0
-            time.sleep(1)
-            pass
-
-        if mode > 1:
-            # speed in knots, convert to km/h
-            d['lat'] = gps_thread.data_stream.lat
-            d['lon'] = gps_thread.data_stream.lon
-            d['alt'] = gps_thread.data_stream.alt
-            d['speed']  = gps_thread.data_stream.speed
-
-            course= gps_thread.data_stream.track
-            if course != "n/a":
-                d['course'] = course
-                d['src'] = "internal"
-                d['mode'] = mode
-        else:
+        for received, tpv in gpsd.read(VIRB_INTERVAL):
+            try:
+                time_updated = update_datetime(tpv.get('time', "n/a"), time_updated)
+            except:
+                pass
+
+            mode = tpv.get('mode', 0)
+            if mode < 2:
+                continue
+            # a fix without time can not be told from the last one
+            if tpv.get('time') is not None and tpv.get('time') == last_fix:
+                duplicates += 1
+                continue
+            last_fix = tpv.get('time')
+
+            # speed in m/s as reported by gpsd
+            d['lat'] = tpv.get('lat', d['lat'])
+            d['lon'] = tpv.get('lon', d['lon'])
+            d['alt'] = tpv.get('alt', tpv.get('altMSL', d['alt']))
+            d['speed'] = tpv.get('speed', d['speed'])
+            d['course'] = tpv.get('track', d['course'])
+            d['src'] = "internal"
+            d['mode'] = mode
+            client.publish_state("/motorhome/gps", d, binary, retain=False)
+
+            # report to publish, and fix to publish if the clock is set
+            internal_time = time.monotonic()
+            latency = internal_time - received
+            latency_sum += latency
+            latency_max = max(latency_max, latency)
+            fix = fix_time(last_fix)
+            if fix is not None:
+                age_sum += time.time() - fix
+            fixes += 1
+
+        now = time.monotonic()
+        if now - internal_time > VIRB_TIMEOUT and now - virb_time >= VIRB_INTERVAL:
+            virb_time = now
             if virb_initialized:
                 try:
                     lat = cam.get_latitude()
@@ -143,21 +153,34 @@ def run_dash_server():
                     d['course'] = 0
                     d['src'] = "garmin"
                     d['mode'] = mode
-                    time.sleep(0.8)
+                    if mode > 1:
+                        client.publish_state("/motorhome/gps", d, binary, retain=False)
                 except:
                     virb_initialized = False
-                    pass
+                    discovery.lost()
             else:
-                virb_ip = search_virb()
+                virb_ip = discovery.ip
                 if virb_ip:
                     cam = Virb((virb_ip, 80))
                     virb_initialized = True
-        if mode > 1:
-            client.publish("/motorhome/gps", json.dumps(d))
-
-        time.sleep(0.2)
 
-    client.disconnect()
+        if now - stats_time >= STATS_INTERVAL:
+            count = max(1, fixes)
+            client.publish("/motorhome/gps_latency",
+                           json.dumps({'id': 'gps_latency',
+                                       'fixes': fixes,
+                                       'duplicates': duplicates,
+                                       'latency_avg': round(1000*latency_sum/count, 3),
+                                       'latency_max': round(1000*latency_max, 3),
+                                       'age_avg': round(1000*age_sum/count, 1),
+                                      }))
+            stats_time = now
+            fixes = duplicates = 0
+            latency_sum = latency_max = age_sum = 0.0
+
+    discovery.stop()
+    gpsd.close()
+    client.stop()
 
 if __name__ == "__main__":
     run_dash_server()
@@ -0,0 +1,95 @@
+"""
+gpsd client of the dash service
+
+Reads the JSON reports of gpsd from a non-blocking socket, so the
+service wakes up when a TPV report arrives instead of polling the last
+values of a reader thread. A lost gpsd connection is retried on the
+next read.
+"""
+import json
+import time
+import select
+import socket
+from datetime import datetime, timezone
+
+GPSD_HOST = '127.0.0.1'
+GPSD_PORT = 2947
+
+WATCH = b'?WATCH={"enable":true,"json":true}\n'
+
+def fix_time(value):
+    """ unix time of a TPV time, e.g. 2021-06-01T10:34:48.283Z, None if invalid """
+    for time_format in ("%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            return datetime.strptime(value, time_format).replace(tzinfo=timezone.utc).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return None
+
+class GpsdClient:
+    """ TPV reports of gpsd """
+    def __init__(self, host=GPSD_HOST, port=GPSD_PORT):
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.buffer = b""
+        self.failed = False
+
+    def connect(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=2)
+            sock.sendall(WATCH)
+        except OSError as err:
+            if not self.failed:
+                print("gpsd client: " + str(err))
+                self.failed = True
+            return False
+
+        sock.setblocking(False)
+        self.sock = sock
+        self.buffer = b""
+        self.failed = False
+        print("gpsd client: connected to gpsd")
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def read(self, timeout):
+        """ (receive time, report) of the TPV reports within timeout seconds """
+        if self.sock is None and not self.connect():
+            time.sleep(timeout)
+            return []
+
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if not ready:
+            return []
+
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return []
+        except OSError:
+            data = b""
+        received = time.monotonic()
+
+        if not data:
+            print("gpsd client: connection lost")
+            self.close()
+            return []
+
+        lines = (self.buffer + data).split(b"\n")
+        self.buffer = lines.pop()
+
+        reports = []
+        for line in lines:
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(report, dict) and report.get('class') == "TPV":
+                reports.append((received, report))
+
+        return reports
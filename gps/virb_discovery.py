@@ -0,0 +1,143 @@
+"""
+Virb discovery of the dash service
+
+A thread looks up the Virb address of the current WiFi network in
+~/.motorhome/network.conf and checks that the camera answers on its HTTP
+port. The SSID is read with the wireless extensions ioctl, as iwgetid
+does, and the camera is probed with a TCP connect, so discovery starts
+no processes. A failed probe is retried after a delay that doubles up to
+BACKOFF_MAX seconds. A new WiFi network, or a camera that stopped
+answering, starts the search again.
+
+network.conf has a section of each SSID with a Virb:
+
+[MyCamperWiFi]
+ip = 192.168.0.10
+"""
+import time
+import array
+import fcntl
+import socket
+import struct
+import threading
+import configparser
+
+VIRB_PORT = 80
+PROBE_TIMEOUT = 1
+
+# seconds between probes of a missing camera, doubled after every failure
+BACKOFF_MIN = 2
+BACKOFF_MAX = 60
+
+# seconds between SSID checks
+WIFI_CHECK = 1
+
+SIOCGIWESSID = 0x8B1B
+IW_ESSID_MAX_SIZE = 32
+# interface name, essid pointer, length, flags of struct iwreq
+IWREQ = struct.Struct("16sPHH")
+IWREQ_SIZE = 32
+
+def wireless_interfaces():
+    """ names of the wireless interfaces """
+    try:
+        with open("/proc/net/wireless") as f:
+            return [line.split(":")[0].strip() for line in f.readlines()[2:]]
+    except OSError:
+        return []
+
+def get_ssid():
+    """ SSID of the first connected wireless interface, "" if none """
+    essid = array.array('B', bytes(IW_ESSID_MAX_SIZE + 1))
+    address, size = essid.buffer_info()
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for interface in wireless_interfaces():
+            request = IWREQ.pack(interface.encode(), address, size, 0).ljust(IWREQ_SIZE, b"\0")
+            try:
+                result = fcntl.ioctl(sock, SIOCGIWESSID, request)
+            except OSError:
+                continue
+
+            length = IWREQ.unpack_from(result)[2]
+            ssid = essid.tobytes()[:length].rstrip(b"\0")
+            if ssid:
+                return ssid.decode(errors='replace')
+
+    return ""
+
+def tcp_probe(ip, port=VIRB_PORT, timeout=PROBE_TIMEOUT):
+    """ ip accepts a connection on port """
+    try:
+        with socket.create_connection((ip, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+class VirbDiscovery(threading.Thread):
+    """ IP address of the Virb of the current WiFi network """
+    def __init__(self, conf_file):
+        threading.Thread.__init__(self, daemon=True)
+        self.conf_file = conf_file
+
+        # found and answering, "" while searching
+        self.ip = ""
+
+        # ssid: Virb address of network.conf, read again on a new network
+        self.cache = {}
+        self.wake = threading.Event()
+        self.search = False
+        self.running = True
+
+    def lookup(self, ssid):
+        """ Virb address of ssid in network.conf, "" if none """
+        if ssid not in self.cache:
+            config = configparser.ConfigParser()
+            try:
+                config.read(self.conf_file)
+                self.cache[ssid] = config.get(ssid, 'ip', fallback="")
+            except configparser.Error as err:
+                print("virb discovery: " + str(err))
+                self.cache[ssid] = ""
+        return self.cache[ssid]
+
+    def lost(self):
+        """ the camera stopped answering, search again now """
+        self.ip = ""
+        self.search = True
+        self.wake.set()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def run(self):
+        ssid = None
+        delay = BACKOFF_MIN
+        probe_time = 0.0
+
+        while self.running:
+            now = time.monotonic()
+
+            current = get_ssid()
+            if current != ssid or self.search:
+                if current != ssid:
+                    print("virb discovery: WiFi network '" + current + "'")
+                    self.cache.clear()
+                ssid = current
+                self.ip = ""
+                self.search = False
+                delay = BACKOFF_MIN
+                probe_time = now
+
+            if ssid and not self.ip and now >= probe_time:
+                ip = self.lookup(ssid)
+                if ip and tcp_probe(ip):
+                    print("virb discovery: Virb at " + ip)
+                    self.ip = ip
+                else:
+                    probe_time = now + delay
+                    delay = min(2*delay, BACKOFF_MAX)
+
+            self.wake.wait(WIFI_CHECK)
+            self.wake.clear()
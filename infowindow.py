@@ -38,7 +38,7 @@ def get_cpu_temp():
 class InfoWindow(QWidget):
     info = pyqtSignal()
 
-    def createWindow(self, infobar, cam_ip):
+    def createWindow(self, infobar, cam_ip, mailbox):
         parent = None
         super(InfoWindow, self).__init__(parent)
 
@@ -48,6 +48,7 @@ class InfoWindow(QWidget):
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.get_cpu_temp)
+        self.timer.timeout.connect(self.update_mqtt_stats)
         self.timer.start(15*1000)
 
         homeButton = QPushButton()
@@ -165,12 +166,16 @@ class InfoWindow(QWidget):
         camLabel = QLabel("Camera IP: " + cam_ip)
         self.cpuTempLabel = QLabel()
         self.get_cpu_temp()
+        self.mailbox = mailbox
+        self.mqttLabel = QLabel()
+        self.update_mqtt_stats()
 
         network_layout = QVBoxLayout()
         network_layout.addWidget(ssidLabel)
         network_layout.addWidget(ipLabel)
         network_layout.addWidget(camLabel)
         network_layout.addWidget(self.cpuTempLabel)
+        network_layout.addWidget(self.mqttLabel)
 
         pages[0].setLayout(vehicle_layout)
         pages[1].setLayout(network_layout)
@@ -196,6 +201,11 @@ class InfoWindow(QWidget):
         print("infowindow: CPU temperature: " + temp + "C")
         return temp
 
+    def update_mqtt_stats(self):
+        received, coalesced, dropped = self.mailbox.stats()
+        self.mqttLabel.setText("MQTT messages: {:d}, coalesced {:d}, dropped {:d}".format(
+            received, coalesced, dropped))
+
     def updateInfobar(self, data):
         self.updateTime(data['time'])
         self.updateTemperature(data['temperature'])
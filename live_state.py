@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Live state segments shared by the daemons and the GUI
+
+Every daemon writes the latest payload of its state topics to a memory
+mapped file, /dev/shm/motorhome/<client id>.state, and the GUI reads the
+slots on its render tick, without the broker. MQTT stays for remote and
+web clients. Enabled in motorhome.conf:
+
+[LiveState]
+enabled = yes
+directory = /dev/shm/motorhome
+
+A segment is a header and a fixed number of slots, one per topic:
+
+    header  magic, version, slot count, slot size, slots in use
+    slot    sequence, CRC-32, topic, time, payload length, binary payload
+
+A slot is written under a seqlock: the writer makes the sequence odd,
+writes the slot and makes it even again. The reader copies a slot when
+its sequence is even and has changed, and keeps the copy only if the
+sequence is the same after it. Each segment has one writer.
+
+Python has no memory barriers, and on the ARM of the Pi another core
+may see the stores out of order, so the sequence alone does not prove a
+copy complete. The reader also checks the payload length against the
+slot size and the CRC-32 of topic, time, length and payload, and takes
+a slot that fails for one being written.
+
+ble/ and gps/ import it from here, their services add the parent
+directory to sys.path. Run it to compare latency and CPU of
+the segment and the broker path.
+"""
+import os
+import sys
+import time
+import mmap
+import zlib
+import struct
+import configparser
+
+MAGIC = b"MHLS"
+VERSION = 2
+
+STATE_DIR = "/dev/shm/motorhome"
+
+# magic, version, slot count, slot size, slots in use
+HEADER = struct.Struct("<4sHHIH")
+USED = struct.Struct("<H")
+USED_OFFSET = 12
+
+# sequence, CRC-32 of the rest of the slot, topic, time, payload length
+SLOT = struct.Struct("<II48sdH2x")
+SEQUENCE = struct.Struct("<I")
+CRC = struct.Struct("<I")
+CRC_OFFSET = SEQUENCE.size
+FIELDS_OFFSET = CRC_OFFSET + CRC.size
+
+SLOTS = 32
+SLOT_SIZE = 512
+
+# render ticks between looking for new or restarted writers
+RESCAN_TICKS = 50
+
+def get_state_dir(conf_file):
+    """ directory of the live state segments, None if not enabled """
+    config = configparser.ConfigParser()
+
+    try:
+        config.read(conf_file)
+        if not config.getboolean('LiveState', 'enabled', fallback=False):
+            return None
+        return config.get('LiveState', 'directory', fallback=STATE_DIR)
+    except (configparser.Error, ValueError) as err:
+        print("live state: invalid [LiveState]: " + str(err))
+        return None
+
+class StateWriter:
+    """ Segment of one daemon """
+    def __init__(self, directory, name, slots=SLOTS, slot_size=SLOT_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, name + ".state")
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT.size
+        self.slots = {}
+        self.sequence = [0]*slots
+
+        # readers only ever see a complete header, the file is renamed in place
+        size = HEADER.size + slots*slot_size
+        fd = os.open(self.path + ".tmp", os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, slots, slot_size, 0)
+        os.replace(self.path + ".tmp", self.path)
+
+    def write(self, topic, payload):
+        """ set the payload of topic, False if it has no slot or does not fit """
+        slot = self.slots.get(topic)
+        if slot is None:
+            if len(self.slots) == len(self.sequence):
+                return False
+            slot = self.slots[topic] = len(self.slots)
+            USED.pack_into(self.map, USED_OFFSET, len(self.slots))
+
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if len(payload) > self.capacity:
+            return False
+
+        offset = HEADER.size + slot*self.slot_size
+        sequence = self.sequence[slot]
+        SEQUENCE.pack_into(self.map, offset, sequence + 1)
+        fields = SLOT.pack(sequence + 1, 0, topic.encode(), time.time(),
+                           len(payload))[FIELDS_OFFSET:]
+        self.map[offset + FIELDS_OFFSET:offset + SLOT.size] = fields
+        start = offset + SLOT.size
+        self.map[start:start + len(payload)] = payload
+        CRC.pack_into(self.map, offset + CRC_OFFSET, zlib.crc32(payload, zlib.crc32(fields)))
+        SEQUENCE.pack_into(self.map, offset, sequence + 2)
+        self.sequence[slot] = sequence + 2
+
+        return True
+
+    def close(self):
+        self.map.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+class StateReader:
+    """ Changed slots of all segments of a directory """
+    def __init__(self, directory):
+        self.directory = directory
+        # path: inode, map, slot count, slot size, last sequence of each slot
+        self.segments = {}
+        self.ticks = 0
+        self.torn = 0
+
+    def scan(self):
+        """ map new segments and segments of restarted writers """
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".state")]
+        except OSError:
+            names = []
+
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                inode = os.stat(path).st_ino
+                segment = self.segments.get(path)
+                if segment is not None and segment[0] == inode:
+                    continue
+
+                with open(path, 'rb') as f:
+                    state_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, version, slots, slot_size, _ = HEADER.unpack_from(state_map)
+            except (OSError, ValueError, struct.error):
+                continue
+
+            if magic != MAGIC or version != VERSION:
+                state_map.close()
+                continue
+
+            if segment is not None:
+                segment[1].close()
+            self.segments[path] = (inode, state_map, slots, slot_size, [0]*slots)
+
+    def poll(self):
+        """ (topic, time, payload) of the slots written since the last poll """
+        if self.ticks % RESCAN_TICKS == 0:
+            self.scan()
+        self.ticks += 1
+
+        changed = []
+        for inode, state_map, slots, slot_size, last in self.segments.values():
+            for slot in range(min(slots, USED.unpack_from(state_map, USED_OFFSET)[0])):
+                offset = HEADER.size + slot*slot_size
+                sequence = SEQUENCE.unpack_from(state_map, offset)[0]
+                if sequence == last[slot] or sequence & 1:
+                    continue
+
+                _, crc, topic, timestamp, length = SLOT.unpack_from(state_map, offset)
+                start = offset + SLOT.size
+                data = state_map[offset + FIELDS_OFFSET:start + length]
+                if (length > slot_size - SLOT.size or zlib.crc32(data) != crc or
+                        SEQUENCE.unpack_from(state_map, offset)[0] != sequence):
+                    # written meanwhile, read on the next poll
+                    self.torn += 1
+                    continue
+                payload = data[SLOT.size - FIELDS_OFFSET:]
+
+                last[slot] = sequence
+                changed.append((topic.rstrip(b"\0").decode(), timestamp, payload))
+
+        return changed
+
+def benchmark_writer(directory, count, rate, broker):
+    """ write count tpms frames to a segment or the broker """
+    from mqtt_payload import encode
+
+    frame = {'id': 'tpms', 'time': 0.0, 'warn': 0,
+             'tires': [[name, 2.45, 21.5, 0, None] for name in ('FL', 'FR', 'RL', 'RR', 'Spear')]}
+
+    if broker:
+        from mqtt_publisher import Publisher
+        publisher = Publisher("live_state_benchmark", broker)
+        publisher.start()
+        time.sleep(1)
+    else:
+        writer = StateWriter(directory, "benchmark")
+        time.sleep(0.5)
+
+    # CPU of the loop itself
+    idle = time.process_time()
+    for _ in range(count//4):
+        frame['time'] = time.time()
+        encode(frame)
+        time.sleep(1/rate)
+    idle = (time.process_time() - idle)*4
+
+    cpu = time.process_time()
+    for _ in range(count):
+        frame['time'] = time.time()
+        if broker:
+            publisher.publish("/motorhome/benchmark", encode(frame))
+        else:
+            writer.write("/motorhome/benchmark", encode(frame))
+        time.sleep(1/rate)
+    cpu = time.process_time() - cpu - idle
+
+    print("writer: %.1f us CPU/message" % (cpu/count*1e6))
+    time.sleep(0.5)
+    if broker:
+        publisher.stop()
+    else:
+        writer.close()
+
+def benchmark(count=2000, rate=500, broker=None):
+    """ latency and CPU of frames from another process """
+    import threading
+    import subprocess
+    from mqtt_payload import decode
+
+    directory = "/dev/shm/motorhome_benchmark"
+    latency = []
+    done = threading.Event()
+
+    def received(payload):
+        latency.append(time.time() - decode(payload)['time'])
+        if len(latency) == count:
+            done.set()
+
+    if broker:
+        import paho.mqtt.client as mqtt
+        client = mqtt.Client("live_state_reader")
+        client.on_message = lambda client, userdata, message: received(message.payload)
+        client.connect(broker)
+        client.subscribe("/motorhome/benchmark")
+        client.loop_start()
+    else:
+        reader = StateReader(directory)
+
+    writer = subprocess.Popen([sys.executable, __file__, "--writer", directory,
+                               str(count), str(rate), broker or ""])
+    # CPU of the reader from the first frame, a segment is polled every ms
+    polls = 0
+    poll_time = 0.0
+    while not latency and writer.poll() is None:
+        if not broker:
+            for topic, timestamp, payload in reader.poll():
+                received(payload)
+        time.sleep(0.001)
+    cpu = time.process_time()
+    while not done.is_set() and writer.poll() is None:
+        if broker:
+            done.wait(0.1)
+        else:
+            start = time.perf_counter()
+            for topic, timestamp, payload in reader.poll():
+                received(payload)
+            poll_time += time.perf_counter() - start
+            polls += 1
+            time.sleep(0.001)
+    cpu = time.process_time() - cpu
+    writer.wait()
+
+    if broker:
+        client.loop_stop()
+        client.disconnect()
+
+    if not latency:
+        print("no messages")
+        return
+
+    latency.sort()
+    print("%s: %d of %d frames, reader %.1f us CPU/message" %
+          ("broker" if broker else "segment", len(latency), count, cpu/len(latency)*1e6))
+    if polls:
+        print("segment poll %.1f us" % (poll_time/polls*1e6))
+    print("latency us: p50 %.1f p90 %.1f p99 %.1f" %
+          tuple(1e6*latency[min(len(latency) - 1, int(len(latency)*p/100))] for p in (50, 90, 99)))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--writer":
+        benchmark_writer(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]), sys.argv[5])
+    else:
+        benchmark()
+        if len(sys.argv) > 1:
+            benchmark(broker=sys.argv[1])
@@ -3,7 +3,9 @@
 Motorhome infotainment project
 """
 import math
+import time
 import sys
+import signal
 import os
 import os.path
 import configparser
@@ -14,10 +16,13 @@ from PyQt5.QtWidgets import QMainWindow, QApplication, QWidget, QLabel, QPushBut
 from PyQt5.QtGui import QIcon, QPixmap
 from PyQt5.QtCore import Qt, QThread, QTimer, QSize, pyqtSignal
 
-from tires import Tires
+from tires import Tires, get_tire_positions
 from virb import Virb
-from ruuvi import Ruuvi
-from mqtt_subscriber import MQTT
+from ruuvi import RuuviTags, get_ruuvitag_locations, OUTDOOR
+from mqtt_subscriber import MQTT, LiveStateSubscriber
+from live_state import get_state_dir
+from mqtt_mailbox import Mailbox, RENDER_INTERVAL
+from snapshot import load_snapshot, save_snapshot, is_stale, format_age, SNAPSHOT_INTERVAL
 from searchvirb import SearchVirb
 
 from speedowindow import SpeedoWindow
@@ -122,8 +127,8 @@ class MainApp(QMainWindow):
         self.gps = GPS()
 
         self.virb = Virb()
-        self.tpms = Tires()
-        self.ruuvi = Ruuvi()
+        self.tpms = Tires(get_tire_positions(str(Path.home()) + "/.motorhome/motorhome.conf"))
+        self.ruuvi = RuuviTags(get_ruuvitag_locations(str(Path.home()) + "/.motorhome/motorhome.conf"))
         self.centralWidget = QWidget()
         size = 64
 
@@ -223,7 +228,7 @@ class MainApp(QMainWindow):
         self.temp_warn_on = QPixmap(self.prefix + "snowflake.png").scaled(32, 32, Qt.KeepAspectRatio)
         self.tempWarnLabel = QLabel()
 
-        self.updateTemperature(self.ruuvi.temperature)
+        self.updateTemperature(self.ruuvi.get_temperature(OUTDOOR))
 
         self.datetimer = QTimer()
         self.datetimer.timeout.connect(self.updateTime)
@@ -322,7 +327,7 @@ class MainApp(QMainWindow):
 
     def createInfoWindow(self):
         """ create window for system information """
-        self.infoWindow.createWindow(self.infobar, self.virb.ip)
+        self.infoWindow.createWindow(self.infobar, self.virb.ip, self.mailbox)
         self.info.connect(self.infoWindow.updateInfobar)
         self.infoWindow.show()
 
@@ -396,101 +401,113 @@ class MainApp(QMainWindow):
         except AttributeError:
             pass
 
-    def setTPMS(self, sensor):
-        """ set TPMS data """
-        tire = sensor[0]
-        self.tpms.set_pressure(tire, sensor[1])
-        self.tpms.set_temperature(tire, sensor[2])
-        self.tpms.set_warn(tire, sensor[3])
+    def setTPMS(self, warn, tires, timestamp=None):
+        """ set TPMS data of a frame, redraw changed tires only """
+        if bool(warn) != self.infobar.tpmsWarn:
+            self.setTPMSWarn(warn)
 
-        try:
-            self.tpmsWindow.setTPMS(self.tpms, tire)
-        except AttributeError:
-            pass
-
-    def initSensorThread(self):
-        """ initialize MQTT thread """
-        self.sensorThread = QThread()
-        self.sensorWorker = MQTT()
-        self.exit_signal.connect(self.sensorWorker.stop)
-        self.sensorWorker.moveToThread(self.sensorThread)
+        for tire, pressure, temperature, warn, _leak in tires:
+            i = self.tpms.update(tire, pressure, temperature, warn, timestamp)
+            if i is None:
+                continue
 
-        self.sensorWorker.finished.connect(self.sensorThread.quit)
-        self.sensorWorker.finished.connect(self.sensorWorker.deleteLater)
-        self.sensorThread.finished.connect(self.sensorThread.deleteLater)
+            try:
+                self.tpmsWindow.setTPMS(self.tpms, i)
+            except AttributeError:
+                pass
 
-        self.sensorThread.started.connect(self.sensorWorker.run)
-        self.sensorWorker.exit_signal.connect(self.sensorWorker.stop)
-
-        """ ruuvitag signals """
-        self.sensorWorker.temperature.connect(self.updateTemperature)
-        self.sensorWorker.humidity.connect(self.updateHumidity)
-        self.sensorWorker.pressure.connect(self.updatePressure)
-        self.sensorWorker.ruuvi_batt.connect(self.updateRuuviBatt)
-
-        """ tpms signals """
-        self.sensorWorker.tpms.connect(self.setTPMS)
-        self.sensorWorker.tpms_warn.connect(self.setTPMSWarn)
+    def initSensorThread(self):
+        """ initialize MQTT thread, or the live state reader if enabled """
+        self.mailbox = Mailbox()
+        self.liveState = None
 
-        """ gps signals """
-        self.sensorWorker.gpsFix.connect(self.updateGPSFix)
-        self.sensorWorker.gpsLocation.connect(self.updateLocation)
+        state_dir = get_state_dir(str(Path.home()) + "/.motorhome/motorhome.conf")
+        if state_dir is not None:
+            self.liveState = LiveStateSubscriber(self.mailbox, state_dir)
+        else:
+            self.sensorThread = QThread()
+            self.sensorWorker = MQTT(self.mailbox)
+            # run() blocks in the network loop, stop from this thread
+            self.exit_signal.connect(self.sensorWorker.stop, Qt.DirectConnection)
+            self.sensorWorker.moveToThread(self.sensorThread)
+
+            self.sensorWorker.finished.connect(self.sensorThread.quit)
+            self.sensorWorker.finished.connect(self.sensorWorker.deleteLater)
+            self.sensorThread.finished.connect(self.sensorThread.deleteLater)
+
+            self.sensorThread.started.connect(self.sensorWorker.run)
+            self.sensorThread.start()
+
+        # last known values until the first messages arrive
+        self.values = load_snapshot()
+        for channel, (timestamp, data) in list(self.values.items()):
+            self.dispatch(channel, timestamp, data)
+
+        # GUI updates of the sensor messages, once per render tick
+        self.rendertimer = QTimer()
+        self.rendertimer.timeout.connect(self.render)
+        self.rendertimer.start(RENDER_INTERVAL)
+
+        self.snapshottimer = QTimer()
+        self.snapshottimer.timeout.connect(self.saveSnapshot)
+        self.snapshottimer.start(SNAPSHOT_INTERVAL*1000)
+        QApplication.instance().aboutToQuit.connect(self.saveSnapshot)
+
+    def render(self):
+        """ update the GUI with the latest sensor values """
+        if self.liveState is not None:
+            self.liveState.poll()
+
+        for channel, value in self.mailbox.drain():
+            self.values[channel] = value
+            self.dispatch(channel, *value)
+
+    def dispatch(self, channel, timestamp, data):
+        """ show the value of a channel """
+        if channel[0] == 'ruuvi':
+            self.updateRuuvi(data, timestamp)
+        elif channel[0] == 'tpms':
+            self.setTPMS(*data, timestamp)
+        elif channel[0] == 'gps':
+            self.updateGPS(data)
+
+    def saveSnapshot(self):
+        """ save the last values, position and speed are not restored """
+        save_snapshot({channel: value for channel, value in self.values.items()
+                       if channel[0] != 'gps'})
+
+    def updateRuuvi(self, data, timestamp=None):
+        """ update Ruuvitag values of one location """
+        location = data[0]
+        # battery voltage is sent in mV
+        vbatt = data[4]/1000 if data[4] is not None else None
+        tag = self.ruuvi.update(location, data[1], data[2], data[3], vbatt, timestamp)
 
-        self.sensorThread.started.connect(self.sensorWorker.run)
+        try:
+            self.ruuviWindow.updateTag(self.ruuvi, tag)
+        except AttributeError:
+            pass
 
-        self.sensorThread.start()
+        if location == OUTDOOR:
+            self.updateTemperature(self.ruuvi.temperature[tag], self.ruuvi.time[tag])
 
-    def updateTemperature(self, temperature):
-        """ update temperature """
+    def updateTemperature(self, temperature, timestamp=None):
+        """ update outdoor temperature on infobar """
         if math.isnan(temperature):
             return
 
         self.infobar.temperature = temperature
-        self.ruuvi.temperature = temperature
 
-        try:
-            self.ruuviWindow.updateTemperature(self.ruuvi.temperature)
-        except AttributeError:
-            pass
-
-        if self.ruuvi.temperature < 3.0:
+        if temperature < 3.0:
             self.tempWarnLabel.setPixmap(self.temp_warn_on)
-        elif self.ruuvi.temperature > 3.2:
+        elif temperature > 3.2:
             self.tempWarnLabel.setPixmap(self.temp_warn_off)
 
-        self.tempInfoLabel.setText("{0:d}".format(round(self.ruuvi.temperature)) + "\u2103")
-
-    def updateHumidity(self, humidity):
-        """ update humidity """
-        if math.isnan(humidity):
-            return
-        self.ruuvi.humidity = humidity
-        try:
-            self.ruuviWindow.updateHumidity(self.ruuvi.humidity)
-        except AttributeError:
-            pass
-
-    def updatePressure(self, pressure):
-        """ update air pressure """
-        if math.isnan(pressure):
-            return
-
-        self.ruuvi.pressure = pressure
-        try:
-            self.ruuviWindow.updatePressure(self.ruuvi.pressure)
-        except AttributeError:
-            pass
-
-    def updateRuuviBatt(self, voltage):
-        """ update Ruuvitag battery voltage """
-        if math.isnan(voltage):
-            return
-
-        self.ruuvi.vbatt = voltage
-        try:
-            self.ruuviWindow.updateRuuviBatt(self.ruuvi.vbatt)
-        except AttributeError:
-            pass
+        text = "{0:d}".format(round(temperature)) + "\u2103"
+        now = time.time()
+        if timestamp is not None and is_stale(timestamp, now):
+            text += " (" + format_age(now - timestamp) + ")"
+        self.tempInfoLabel.setText(text)
 
     def updateGPSFix(self, fix):
         """ Update GPS fix status """
@@ -511,6 +528,12 @@ class MainApp(QMainWindow):
         except AttributeError:
             pass
 
+    def updateGPS(self, data):
+        """ update GPS fix and location of a message """
+        if data[6] != self.gps.fix:
+            self.updateGPSFix(data[6])
+        self.updateLocation(data)
+
     def updateLocation(self, location):
         """ update location """
         self.gps.lat = location[0]
@@ -536,14 +559,25 @@ class MainApp(QMainWindow):
         else:
             self.recInfoLabel.setPixmap(self.rec_off)
 
+    def terminate(self, signum, frame):
+        """ SIGTERM from systemd, stop the workers and quit """
+        print("motorhome: terminating")
+        self.exit_signal.emit()
+        QApplication.quit()
+
     def keyPressEvent(self, event):
         """ check if ESC is pressed """
         if event.key() == Qt.Key_Escape:
             self.exit_signal.emit()
             self.datetimer.stop()
+            self.rendertimer.stop()
+            self.snapshottimer.stop()
+            self.saveSnapshot()
             sys.exit()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     win = MainApp()
+    # the handler runs when Python next has control, on the render tick
+    signal.signal(signal.SIGTERM, win.terminate)
     sys.exit(app.exec_())
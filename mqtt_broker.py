@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+"""
+MQTT broker for motorhome infotainment
+
+A small asyncio broker that can stand in for mosquitto on a single box
+(mqtt_broker.service), and be used for tests and benchmarks. It speaks
+MQTT 3.1 and 3.1.1 over TCP and over websockets for html/compass.html:
+
+ * QoS 0 and 1, QoS 2 publishes are acknowledged and delivered as QoS 1
+ * retained messages, last will, keepalive timeout
+ * + and # wildcards
+ * clean sessions only, a reconnecting client starts with no
+   subscriptions
+
+Ports are set in motorhome.conf:
+
+[Broker]
+host = localhost
+port = 1883
+websocket_port = 9001
+
+Run with --benchmark against a running broker, this one or mosquitto,
+to measure throughput and latency:
+
+    mqtt_broker.py --benchmark --port 1883
+"""
+import sys
+import time
+import base64
+import struct
+import signal
+import asyncio
+import hashlib
+import argparse
+import configparser
+from pathlib import Path
+
+HOST = 'localhost'
+PORT = 1883
+WEBSOCKET_PORT = 9001
+
+# packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+PROTOCOLS = {(b"MQIsdp", 3), (b"MQTT", 4)}
+
+MAX_PACKET = 256*1024
+CONNECT_TIMEOUT = 10
+
+# QoS 0 messages to a client are dropped while this much is unsent
+MAX_BUFFER = 1024*1024
+
+# QoS 1 messages to a client are dropped while this many are not
+# acknowledged, sessions are clean so nothing is resent on reconnect
+MAX_INFLIGHT = 256
+
+# topics of the route cache, cleared on every subscription change
+ROUTE_CACHE = 1024
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WEBSOCKET_PROTOCOLS = ("mqtt", "mqttv3.1")
+
+def get_broker_config(conf_file):
+    """ host, port and websocket port of the broker """
+    config = configparser.ConfigParser()
+
+    try:
+        config.read(conf_file)
+        return (config.get('Broker', 'host', fallback=HOST),
+                config.getint('Broker', 'port', fallback=PORT),
+                config.getint('Broker', 'websocket_port', fallback=WEBSOCKET_PORT))
+    except (configparser.Error, ValueError) as err:
+        print("broker: invalid [Broker]: " + str(err))
+        return HOST, PORT, WEBSOCKET_PORT
+
+def remaining_length(length):
+    """ encoded remaining length of a packet """
+    encoded = bytearray()
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        if length:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+def packet(packet_type, flags, body):
+    return bytes((packet_type << 4 | flags,)) + remaining_length(len(body)) + body
+
+def publish_packet(topic, payload, qos, retain, packet_id=0, dup=False):
+    topic = topic.encode()
+    body = struct.pack(">H", len(topic)) + topic
+    if qos:
+        body += struct.pack(">H", packet_id)
+    return packet(PUBLISH, dup << 3 | qos << 1 | retain, body + payload)
+
+def read_string(body, offset):
+    """ length prefixed field and the offset after it """
+    length = struct.unpack_from(">H", body, offset)[0]
+    end = offset + 2 + length
+    if end > len(body):
+        raise ValueError("field past the end of the packet")
+    return body[offset + 2:end], end
+
+async def read_packet(reader):
+    """ type, flags and body of the next packet """
+    header = (await reader.readexactly(1))[0]
+
+    length = 0
+    for shift in (0, 7, 14, 21):
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+    else:
+        raise ValueError("malformed remaining length")
+
+    if length > MAX_PACKET:
+        raise ValueError("packet of %d bytes" % length)
+
+    body = await reader.readexactly(length) if length else b""
+    return header >> 4, header & 0x0F, body
+
+def matches(filter_levels, topic_levels):
+    """ topic filter with + and # wildcards matches topic """
+    if topic_levels[0].startswith("$") and filter_levels[0] in ("+", "#"):
+        return False
+
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+
+    return len(filter_levels) == len(topic_levels)
+
+def valid_filter(topic_filter):
+    levels = topic_filter.split("/")
+    for i, level in enumerate(levels):
+        if "#" in level and (level != "#" or i != len(levels) - 1):
+            return False
+        if "+" in level and level != "+":
+            return False
+    return bool(topic_filter)
+
+class WebSocketReader:
+    """ MQTT stream of the binary frames of a websocket """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.buffer = bytearray()
+
+    async def readexactly(self, n):
+        while len(self.buffer) < n:
+            await self.read_frame()
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    async def read_frame(self):
+        first, second = await self.reader.readexactly(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", await self.reader.readexactly(8))[0]
+        if length > MAX_PACKET:
+            raise ValueError("websocket frame of %d bytes" % length)
+
+        mask = await self.reader.readexactly(4) if second & 0x80 else None
+        data = await self.reader.readexactly(length)
+        if mask is not None and length:
+            key = (mask*(length//4 + 1))[:length]
+            data = (int.from_bytes(data, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+        if opcode in (0x0, 0x1, 0x2):
+            self.buffer += data
+        elif opcode == 0x8:
+            self.writer.write(b"\x88\x00")
+            raise ConnectionResetError("websocket closed")
+        elif opcode == 0x9:
+            # control frames carry at most 125 bytes
+            if length > 125:
+                raise ValueError("websocket ping of %d bytes" % length)
+            self.writer.write(bytes((0x8A, length)) + data)
+
+class WebSocketWriter:
+    """ writes MQTT packets as binary websocket frames """
+    def __init__(self, writer):
+        self.writer = writer
+        self.transport = writer.transport
+
+    def write(self, data):
+        length = len(data)
+        if length < 126:
+            header = bytes((0x82, length))
+        elif length < 0x10000:
+            header = struct.pack(">BBH", 0x82, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x82, 127, length)
+        self.writer.write(header + data)
+
+    def close(self):
+        self.writer.close()
+
+class Session:
+    """ Connected client """
+    def __init__(self, client_id, writer, peer):
+        self.client_id = client_id
+        self.writer = writer
+        self.peer = peer
+        self.subscriptions = {}
+        self.will = None
+        self.packet_id = 0
+        # QoS 1 messages sent and not acknowledged, by packet id
+        self.inflight = {}
+        self.dropped = 0
+        self.closed = False
+
+    def send(self, data, qos=0):
+        if self.closed:
+            return
+        if qos == 0 and self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.dropped += 1
+            return
+        self.writer.write(data)
+
+    def next_packet_id(self):
+        self.packet_id = self.packet_id % 0xFFFF + 1
+        return self.packet_id
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+class Broker:
+    """ Sessions, subscriptions and retained messages """
+    def __init__(self):
+        self.sessions = {}
+        # topic filter: (levels, {session: qos})
+        self.subscriptions = {}
+        # topic: (payload, qos)
+        self.retained = {}
+        # topic: [(session, qos)]
+        self.routes = {}
+        self.received = 0
+        self.sent = 0
+        self.anonymous = 0
+
+    async def handle_tcp(self, reader, writer):
+        await self.serve(reader, writer, writer.get_extra_info('peername'))
+
+    async def handle_websocket(self, reader, writer):
+        """ websocket handshake, then MQTT over binary frames """
+        peer = writer.get_extra_info('peername')
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), CONNECT_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+
+        headers = {}
+        for line in request.decode('latin-1').split("\r\n")[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        key = headers.get('sec-websocket-key')
+        if key is None or headers.get('upgrade', '').lower() != "websocket":
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            writer.close()
+            return
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        response = ("HTTP/1.1 101 Switching Protocols\r\n"
+                    "Upgrade: websocket\r\n"
+                    "Connection: Upgrade\r\n"
+                    "Sec-WebSocket-Accept: " + accept + "\r\n")
+        protocols = [p.strip() for p in headers.get('sec-websocket-protocol', '').split(",")]
+        for protocol in WEBSOCKET_PROTOCOLS:
+            if protocol in protocols:
+                response += "Sec-WebSocket-Protocol: " + protocol + "\r\n"
+                break
+        writer.write((response + "\r\n").encode())
+
+        await self.serve(WebSocketReader(reader, writer), WebSocketWriter(writer), peer)
+
+    async def serve(self, reader, writer, peer):
+        """ MQTT session of one connection """
+        session = None
+        clean = False
+        try:
+            packet_type, flags, body = await asyncio.wait_for(read_packet(reader), CONNECT_TIMEOUT)
+            if packet_type != CONNECT:
+                raise ValueError("first packet is not CONNECT")
+            session, keepalive = self.connect(body, writer, peer)
+            if session is None:
+                return
+
+            timeout = 1.5*keepalive if keepalive else None
+            while True:
+                packet_type, flags, body = await asyncio.wait_for(read_packet(reader), timeout)
+                if packet_type == DISCONNECT:
+                    clean = True
+                    break
+                self.handle(session, packet_type, flags, body)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except (ValueError, IndexError, struct.error) as err:
+            print("broker: " + str(peer) + ": " + str(err))
+        finally:
+            if session is not None:
+                self.disconnect(session, clean)
+            else:
+                writer.close()
+
+    def connect(self, body, writer, peer):
+        """ session of a CONNECT, None if refused """
+        protocol, offset = read_string(body, 0)
+        level, connect_flags, keepalive = struct.unpack_from(">BBH", body, offset)
+        offset += 4
+        if (protocol, level) not in PROTOCOLS:
+            writer.write(packet(CONNACK, 0, b"\x00\x01"))
+            writer.close()
+            return None, 0
+
+        client_id, offset = read_string(body, offset)
+        client_id = client_id.decode()
+        if not client_id:
+            self.anonymous += 1
+            client_id = "anonymous-%d" % self.anonymous
+
+        will = None
+        if connect_flags & 0x04:
+            will_topic, offset = read_string(body, offset)
+            will_message, offset = read_string(body, offset)
+            will = (will_topic.decode(), will_message,
+                    (connect_flags >> 3) & 0x03, bool(connect_flags & 0x20))
+
+        # a client id connects once, the older connection is closed
+        old = self.sessions.get(client_id)
+        if old is not None:
+            self.disconnect(old, True)
+
+        session = Session(client_id, writer, peer)
+        session.will = will
+        self.sessions[client_id] = session
+        writer.write(packet(CONNACK, 0, b"\x00\x00"))
+
+        return session, keepalive
+
+    def disconnect(self, session, clean):
+        """ end a session, publish its will unless it disconnected """
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+
+        for topic_filter in list(session.subscriptions):
+            self.unsubscribe(session, topic_filter)
+        session.close()
+
+        if not clean and session.will is not None:
+            topic, payload, qos, retain = session.will
+            self.publish(topic, payload, qos, retain)
+
+    def handle(self, session, packet_type, flags, body):
+        if packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = read_string(body, 0)
+            if qos:
+                packet_id = struct.unpack_from(">H", body, offset)[0]
+                offset += 2
+                session.send(packet(PUBACK if qos == 1 else PUBREC, 0,
+                                    struct.pack(">H", packet_id)), qos)
+            self.received += 1
+            self.publish(topic.decode(), body[offset:], min(qos, 1), flags & 0x01)
+        elif packet_type == PUBACK:
+            session.inflight.pop(struct.unpack(">H", body)[0], None)
+        elif packet_type == PUBREL:
+            session.send(packet(PUBCOMP, 0, body[:2]), 1)
+        elif packet_type == SUBSCRIBE:
+            self.subscribe(session, body)
+        elif packet_type == UNSUBSCRIBE:
+            packet_id = body[:2]
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = read_string(body, offset)
+                self.unsubscribe(session, topic_filter.decode())
+            session.send(packet(UNSUBACK, 0, packet_id), 1)
+        elif packet_type == PINGREQ:
+            session.send(packet(PINGRESP, 0, b""), 1)
+
+    def subscribe(self, session, body):
+        """ add the filters of a SUBSCRIBE, send the retained messages """
+        packet_id = body[:2]
+        offset = 2
+        granted = bytearray()
+        topic_filters = []
+        while offset < len(body):
+            topic_filter, offset = read_string(body, offset)
+            topic_filter = topic_filter.decode()
+            if offset >= len(body):
+                raise ValueError("SUBSCRIBE filter without QoS")
+            qos = min(body[offset] & 0x03, 1)
+            offset += 1
+
+            if not valid_filter(topic_filter):
+                granted.append(0x80)
+                continue
+
+            levels, subscribers = self.subscriptions.setdefault(
+                topic_filter, (topic_filter.split("/"), {}))
+            subscribers[session] = qos
+            session.subscriptions[topic_filter] = qos
+            granted.append(qos)
+            topic_filters.append((levels, qos))
+
+        self.routes.clear()
+        session.send(packet(SUBACK, 0, packet_id + bytes(granted)), 1)
+
+        for topic, (payload, retained_qos) in self.retained.items():
+            topic_levels = topic.split("/")
+            for levels, qos in topic_filters:
+                if matches(levels, topic_levels):
+                    self.send(session, topic, payload, min(qos, retained_qos), True)
+                    break
+
+    def unsubscribe(self, session, topic_filter):
+        session.subscriptions.pop(topic_filter, None)
+        subscription = self.subscriptions.get(topic_filter)
+        if subscription is not None:
+            subscription[1].pop(session, None)
+            if not subscription[1]:
+                del self.subscriptions[topic_filter]
+        self.routes.clear()
+
+    def route(self, topic):
+        """ sessions subscribed to topic with their QoS """
+        targets = self.routes.get(topic)
+        if targets is not None:
+            return targets
+
+        topic_levels = topic.split("/")
+        qos_by_session = {}
+        for levels, subscribers in self.subscriptions.values():
+            if matches(levels, topic_levels):
+                for session, qos in subscribers.items():
+                    if qos >= qos_by_session.get(session, 0):
+                        qos_by_session[session] = qos
+
+        targets = list(qos_by_session.items())
+        if len(self.routes) >= ROUTE_CACHE:
+            self.routes.clear()
+        self.routes[topic] = targets
+        return targets
+
+    def publish(self, topic, payload, qos, retain):
+        """ store a retained message and send it to the subscribers """
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+
+        qos0 = None
+        for session, sub_qos in self.route(topic):
+            if qos and sub_qos:
+                self.send(session, topic, payload, 1, False)
+            else:
+                # one packet for all QoS 0 subscribers
+                if qos0 is None:
+                    qos0 = publish_packet(topic, payload, 0, False)
+                session.send(qos0)
+                self.sent += 1
+
+    def send(self, session, topic, payload, qos, retain):
+        if qos:
+            if len(session.inflight) >= MAX_INFLIGHT:
+                session.dropped += 1
+                return
+            packet_id = session.next_packet_id()
+            session.inflight[packet_id] = topic
+            session.send(publish_packet(topic, payload, 1, retain, packet_id), 1)
+        else:
+            session.send(publish_packet(topic, payload, 0, retain))
+        self.sent += 1
+
+async def run_broker(host, port, websocket_port):
+    broker = Broker()
+    servers = [await asyncio.start_server(broker.handle_tcp, host, port)]
+    if websocket_port:
+        servers.append(await asyncio.start_server(broker.handle_websocket, host, websocket_port))
+    print("broker: listening on %s port %d, websockets on %s" % (host, port, websocket_port or "-"))
+
+    stop = asyncio.get_running_loop().create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signum, stop.cancel)
+    try:
+        await stop
+    except asyncio.CancelledError:
+        pass
+
+    for server in servers:
+        server.close()
+    print("broker: %d messages received, %d sent" % (broker.received, broker.sent))
+
+def run_benchmark(host, port, count, rate, qos):
+    """ throughput and latency of messages through a broker """
+    import threading
+    import paho.mqtt.client as mqtt
+
+    latency = []
+    done = threading.Event()
+
+    def on_message(client, userdata, message):
+        latency.append(time.perf_counter() - struct.unpack_from("<d", message.payload)[0])
+        if len(latency) == count:
+            done.set()
+
+    subscriber = mqtt.Client("benchmark_sub")
+    subscriber.on_message = on_message
+    subscriber.connect(host, port)
+    subscriber.subscribe("/motorhome/benchmark", qos)
+    subscriber.loop_start()
+
+    publisher = mqtt.Client("benchmark_pub")
+    publisher.connect(host, port)
+    publisher.loop_start()
+    time.sleep(0.5)
+
+    padding = bytes(100)
+    start = time.perf_counter()
+    for i in range(count):
+        publisher.publish("/motorhome/benchmark", struct.pack("<d", time.perf_counter()) + padding, qos)
+        if rate:
+            time.sleep(max(0.0, start + (i + 1)/rate - time.perf_counter()))
+    done.wait(10 + count/1000)
+    elapsed = time.perf_counter() - start
+
+    publisher.loop_stop()
+    subscriber.loop_stop()
+    publisher.disconnect()
+    subscriber.disconnect()
+
+    if not latency:
+        print("no messages received")
+        return
+
+    latency.sort()
+    print("QoS %d %s: %d of %d messages, %.0f messages/s" %
+          (qos, "%.0f/s" % rate if rate else "flood", len(latency), count, len(latency)/elapsed))
+    print("latency ms: p50 %.2f p90 %.2f p99 %.2f max %.2f" %
+          tuple(1000*latency[min(len(latency) - 1, int(len(latency)*p/100))] for p in (50, 90, 99, 100)))
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT broker")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="measure a running broker")
+    parser.add_argument('--host', help="broker host")
+    parser.add_argument('--port', type=int, help="broker port")
+    parser.add_argument('--websocket-port', type=int, help="websocket port, 0 for none")
+    parser.add_argument('-n', '--count', type=int, default=20000,
+                        help="benchmark messages")
+    args = parser.parse_args()
+
+    host, port, websocket_port = get_broker_config(str(Path.home()) + "/.motorhome/motorhome.conf")
+    host = args.host or host
+    port = args.port or port
+    if args.websocket_port is not None:
+        websocket_port = args.websocket_port
+
+    if args.benchmark:
+        for qos in (0, 1):
+            run_benchmark(host, port, args.count, None, qos)
+            run_benchmark(host, port, min(args.count, 5000), 1000, qos)
+        return 0
+
+    asyncio.run(run_broker(host, port, websocket_port))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Latest value mailbox between the MQTT thread and the GUI
+
+The MQTT thread puts every message in its channel, replacing a value the
+GUI has not taken yet. The GUI drains the mailbox on a render tick, so
+it handles at most one value per channel per tick whatever the message
+rate, and never a stale one. Replaced values are counted as coalesced.
+"""
+import threading
+
+# render tick of the GUI in ms
+RENDER_INTERVAL = 100
+
+# channels kept, values of further channels are dropped
+MAX_CHANNELS = 32
+
+class Mailbox:
+    """ Latest value of each channel """
+    def __init__(self, max_channels=MAX_CHANNELS):
+        self.lock = threading.Lock()
+        self.latest = {}
+        self.max_channels = max_channels
+
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def put(self, channel, value):
+        """ set the value of channel, from the MQTT thread """
+        with self.lock:
+            self.received += 1
+            if channel in self.latest:
+                self.coalesced += 1
+            elif len(self.latest) >= self.max_channels:
+                self.dropped += 1
+                return
+            self.latest[channel] = value
+
+    def drain(self):
+        """ take the channels set since the last drain, from the GUI thread """
+        with self.lock:
+            latest, self.latest = self.latest, {}
+        return latest.items()
+
+    def stats(self):
+        """ received, coalesced and dropped values """
+        return self.received, self.coalesced, self.dropped
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Binary payloads of the motorhome MQTT bus
+
+gps, tpms and ruuvi messages can be sent as packed structs instead of
+JSON. A binary payload starts with MAGIC (never the first byte of JSON
+text), the schema version and the message type; decode() takes either
+format, so a topic can be switched without restarting its subscribers.
+Topics sent in binary are set in motorhome.conf:
+
+[MQTT]
+binary = tpms, ruuvitag
+
+gps stays JSON by default, html/compass.html reads it in the browser.
+
+ble/ and gps/ import it from here, their services add the parent
+directory to sys.path. Run it to compare encode and decode cost
+and payload size of both formats.
+"""
+import math
+import json
+import struct
+import configparser
+
+MAGIC = 0xA5
+VERSION = 2
+
+TYPE_GPS = 1
+TYPE_TPMS = 2
+TYPE_RUUVI = 3
+
+# magic, version, type
+HEADER = struct.Struct("<BBB")
+
+# lat, lon, alt, speed, course, mode, source
+GPS = struct.Struct("<ddfffBB")
+GPS_SOURCES = ("internal", "garmin")
+
+# time, warn; each tire after it: position name length, position name,
+# pressure, temperature, warn, leak rate
+TPMS = struct.Struct("<dB")
+TIRE = struct.Struct("<ffBf")
+
+# location length, location, temperature, humidity, pressure, battery (mV)
+RUUVI = struct.Struct("<fffH")
+
+DEFAULT_BINARY = ('tpms', 'ruuvitag')
+
+def get_binary_topics(conf_file):
+    """ names of the topics sent in binary """
+    config = configparser.ConfigParser()
+
+    try:
+        config.read(conf_file)
+        topics = config.get('MQTT', 'binary', fallback=','.join(DEFAULT_BINARY))
+    except configparser.Error:
+        topics = ','.join(DEFAULT_BINARY)
+
+    return set(topic.strip() for topic in topics.split(',') if topic.strip())
+
+def number(value):
+    """ float of value, nan for None and 'n/a' """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+def optional(value):
+    """ None for nan """
+    return None if math.isnan(value) else value
+
+def encode_gps(d):
+    return HEADER.pack(MAGIC, VERSION, TYPE_GPS) + GPS.pack(
+        number(d['lat']), number(d['lon']), number(d['alt']),
+        number(d['speed']), number(d['course']), d['mode'],
+        1 if d['src'] == "garmin" else 0)
+
+def decode_gps(payload, offset):
+    lat, lon, alt, speed, course, mode, src = GPS.unpack_from(payload, offset)
+    return {'id': "gps",
+            'lat': lat,
+            'lon': lon,
+            'alt': alt,
+            'speed': speed,
+            'course': course,
+            'mode': mode,
+            'src': GPS_SOURCES[src] if src < len(GPS_SOURCES) else "",
+           }
+
+def encode_tpms(frame):
+    parts = [HEADER.pack(MAGIC, VERSION, TYPE_TPMS),
+             TPMS.pack(frame['time'], frame['warn'])]
+    for name, pressure, temperature, warn, leak in frame['tires']:
+        name = name.encode()
+        parts.append(bytes((len(name),)) + name +
+                     TIRE.pack(pressure, temperature, warn, number(leak)))
+
+    return b"".join(parts)
+
+def decode_tpms(payload, offset):
+    timestamp, warn = TPMS.unpack_from(payload, offset)
+    offset += TPMS.size
+
+    tires = []
+    while offset < len(payload):
+        length = payload[offset]
+        name = bytes(payload[offset + 1:offset + 1 + length]).decode()
+        pressure, temperature, tire_warn, leak = TIRE.unpack_from(payload, offset + 1 + length)
+        tires.append((name, pressure, temperature, tire_warn, optional(leak)))
+        offset += 1 + length + TIRE.size
+
+    return {'id': 'tpms', 'time': timestamp, 'warn': warn, 'tires': tires}
+
+def encode_ruuvi(state):
+    location = state['location'].encode()
+    battery = state['battery']
+    return (HEADER.pack(MAGIC, VERSION, TYPE_RUUVI) +
+            bytes((len(location),)) + location +
+            RUUVI.pack(number(state['temperature']), number(state['humidity']),
+                       number(state['pressure']),
+                       0 if battery is None else battery))
+
+def decode_ruuvi(payload, offset):
+    length = payload[offset]
+    location = bytes(payload[offset + 1:offset + 1 + length]).decode()
+    temperature, humidity, pressure, battery = RUUVI.unpack_from(payload, offset + 1 + length)
+    return {'id': 'ruuvi',
+            'location': location,
+            'temperature': optional(temperature),
+            'humidity': optional(humidity),
+            'pressure': optional(pressure),
+            'battery': battery or None,
+           }
+
+ENCODERS = {'gps': encode_gps, 'tpms': encode_tpms, 'ruuvi': encode_ruuvi}
+DECODERS = {TYPE_GPS: decode_gps, TYPE_TPMS: decode_tpms, TYPE_RUUVI: decode_ruuvi}
+
+def encode(message, binary=True):
+    """ payload of a message dict, binary if its id has a schema """
+    encoder = ENCODERS.get(message.get('id'))
+    if binary and encoder is not None:
+        return encoder(message)
+    return json.dumps(message)
+
+def decode(payload):
+    """ message dict of a binary or JSON payload, ValueError if invalid """
+    if payload[:1] == b"\xa5":
+        try:
+            magic, version, msg_type = HEADER.unpack_from(payload)
+            decoder = DECODERS.get(msg_type)
+            if version != VERSION or decoder is None:
+                raise ValueError("unknown payload version %d type %d" % (version, msg_type))
+            return decoder(payload, HEADER.size)
+        except (struct.error, IndexError) as err:
+            raise ValueError("truncated payload: " + str(err))
+
+    return json.loads(payload)
+
+def benchmark():
+    """ print cost and size of JSON and binary payloads """
+    import timeit
+
+    messages = {
+        'gps': {'id': "gps", 'lat': 60.1699, 'lon': 24.9384, 'alt': 12.5,
+                'speed': 22.4, 'course': 187.0, 'mode': 3, 'src': "internal"},
+        'tpms': {'id': 'tpms', 'time': 1700000000.25, 'warn': 0,
+                 'tires': [[name, 2.45, 21.5, 0, 0.002]
+                           for name in ('FL', 'FR', 'RL', 'RR', 'Spear')]},
+        'ruuvi': {'id': 'ruuvi', 'location': 'outdoor', 'temperature': 24.3,
+                  'humidity': 53.49, 'pressure': 1000.44, 'battery': 2977},
+    }
+
+    n = 20000
+    for name, message in messages.items():
+        text = json.dumps(message).encode()
+        binary = encode(message)
+        assert decode(binary)['id'] == message['id']
+
+        json_enc = timeit.timeit(lambda: json.dumps(message).encode(), number=n)/n
+        json_dec = timeit.timeit(lambda: json.loads(text.decode("utf-8", "ignore")), number=n)/n
+        bin_enc = timeit.timeit(lambda: encode(message), number=n)/n
+        bin_dec = timeit.timeit(lambda: decode(binary), number=n)/n
+
+        print("%-6s JSON %3d bytes, encode %.2f us, decode %.2f us" %
+              (name, len(text), json_enc*1e6, json_dec*1e6))
+        print("%-6s bin  %3d bytes, encode %.2f us, decode %.2f us" %
+              (name, len(binary), bin_enc*1e6, bin_dec*1e6))
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,274 @@
+"""
+Buffered MQTT publisher of the motorhome daemons
+
+Runs the paho network loop, in its own thread with start() or on the
+asyncio event loop of the daemon with run(), so keepalives are sent and
+a lost broker connection is retried with exponential backoff. Messages
+published while disconnected wait in a bounded queue, the oldest dropped
+first, and are sent in batches once connected again. Subscriptions are
+renewed on every connect.
+
+State messages are published retained with publish_state(), which also
+writes them to the live state segment of the daemon if [LiveState] is
+enabled, see live_state.py.
+
+Queue depth and publish latency, the time from publish() until paho has
+the message, are published every STATS_INTERVAL seconds on
+/motorhome/publisher/<client id>.
+
+ble/ and gps/ import it from here, their services add the parent
+directory to sys.path.
+"""
+import time
+import json
+import asyncio
+import threading
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from mqtt_payload import encode
+from live_state import StateWriter
+
+BROKER = 'localhost'
+
+# messages kept while disconnected, handed to paho at once
+MAX_QUEUE = 1000
+BATCH = 50
+
+# reconnect delay in seconds, doubled after every failed attempt
+RECONNECT_MIN = 1
+RECONNECT_MAX = 60
+
+STATS_INTERVAL = 60
+
+class AsyncioHelper:
+    """ run the MQTT client network loop in an asyncio event loop """
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+        self.closed = None
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+        self.closed = self.loop.create_future()
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+        if self.closed is not None and not self.closed.done():
+            self.closed.set_result(None)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        """ keepalive and retries """
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+class Publisher:
+    """ MQTT client of a daemon, used like a paho client """
+    def __init__(self, client_id, broker=BROKER, max_queue=MAX_QUEUE, batch=BATCH,
+                 state_dir=None):
+        self.client_id = client_id
+        self.broker = broker
+        self.client = mqtt.Client(client_id)
+        self.client.on_connect = self.handle_connect
+        self.client.on_disconnect = self.handle_disconnect
+        self.client.reconnect_delay_set(RECONNECT_MIN, RECONNECT_MAX)
+
+        # called like the paho on_connect with this publisher as client
+        self.on_connect = None
+
+        self.connected = False
+        self.subscriptions = []
+
+        # topic, payload, qos, retain, time of publish()
+        self.queue = deque(maxlen=max_queue)
+        self.batch = batch
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+        self.published = 0
+        self.dropped = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+        self.stats_time = time.monotonic()
+
+        # live state segment, None if not enabled
+        self.state = None
+        if state_dir is not None:
+            try:
+                self.state = StateWriter(state_dir, client_id)
+            except OSError as err:
+                print("MQTT: " + client_id + ": no live state segment: " + str(err))
+
+    def start(self):
+        """ run the network loop in a thread of paho """
+        self.client.connect_async(self.broker)
+        self.client.loop_start()
+
+    async def run(self):
+        """ run the network loop on the running event loop until cancelled """
+        helper = AsyncioHelper(asyncio.get_running_loop(), self.client)
+        delay = RECONNECT_MIN
+
+        try:
+            while True:
+                try:
+                    self.client.connect(self.broker)
+                    delay = RECONNECT_MIN
+                    await helper.closed
+                except OSError as err:
+                    print("MQTT: " + self.client_id + ": " + str(err))
+
+                await asyncio.sleep(delay)
+                delay = min(2*delay, RECONNECT_MAX)
+        finally:
+            self.flush()
+            self.client.disconnect()
+
+    def stop(self):
+        """ send what is queued and disconnect """
+        self.flush()
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def handle_connect(self, client, userdata, flags, rc):
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            print("MQTT: " + self.client_id + ": connect failed with result code " + str(rc))
+            return
+
+        self.connected = True
+        for topic in self.subscriptions:
+            client.subscribe(topic)
+
+        if self.on_connect is not None:
+            self.on_connect(self, userdata, flags, rc)
+
+        self.flush()
+
+    def handle_disconnect(self, client, userdata, rc):
+        self.connected = False
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            print("MQTT: " + self.client_id + ": connection lost, " + str(len(self.queue)) + " queued")
+
+    def subscribe(self, topic):
+        """ subscribe to topic now and after every reconnect """
+        if topic not in self.subscriptions:
+            self.subscriptions.append(topic)
+        if self.connected:
+            self.client.subscribe(topic)
+
+    def message_callback_add(self, topic, callback):
+        self.client.message_callback_add(topic, callback)
+
+    def socket(self):
+        return self.client.socket()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        """ queue a message and send the queue if connected """
+        now = time.monotonic()
+
+        # nothing waiting, send it right away
+        if self.connected and not self.queue and self.flush_lock.acquire(blocking=False):
+            try:
+                sent = self.client.publish(topic, payload, qos, retain).rc != mqtt.MQTT_ERR_NO_CONN
+            finally:
+                self.flush_lock.release()
+            if sent:
+                self.published += 1
+                self.latency_count += 1
+                self.latency_sum += time.monotonic() - now
+                if now - self.stats_time >= STATS_INTERVAL:
+                    self.report(now)
+                return
+            self.connected = False
+
+        with self.lock:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append((topic, payload, qos, retain, now))
+
+        if self.connected:
+            self.flush()
+
+        if now - self.stats_time >= STATS_INTERVAL:
+            self.report(now)
+
+    def publish_state(self, topic, message, binary=False, retain=True):
+        """ publish a state message, binary if it has a schema, and write
+        it to the live state segment """
+        payload = encode(message, binary)
+        self.publish(topic, payload, retain=retain)
+
+        if self.state is not None:
+            self.state.write(topic, payload)
+
+    def flush(self):
+        """ hand the queue to paho, a batch at a time """
+        while self.connected and self.queue:
+            # another thread is sending, it takes this message too
+            if not self.flush_lock.acquire(blocking=False):
+                return
+
+            try:
+                while self.connected:
+                    with self.lock:
+                        batch = [self.queue.popleft()
+                                 for _ in range(min(self.batch, len(self.queue)))]
+                    if not batch:
+                        break
+
+                    for i, (topic, payload, qos, retain, queued) in enumerate(batch):
+                        if self.client.publish(topic, payload, qos, retain).rc == mqtt.MQTT_ERR_NO_CONN:
+                            self.connected = False
+                            with self.lock:
+                                self.queue.extendleft(reversed(batch[i:]))
+                            return
+
+                        latency = time.monotonic() - queued
+                        self.latency_sum += latency
+                        self.latency_count += 1
+                        if latency > self.latency_max:
+                            self.latency_max = latency
+                        self.published += 1
+            finally:
+                self.flush_lock.release()
+
+    def stats(self):
+        """ queue depth, counters and publish latency in ms """
+        count = max(1, self.latency_count)
+        return {'id': 'publisher',
+                'client': self.client_id,
+                'connected': self.connected,
+                'queue': len(self.queue),
+                'published': self.published,
+                'dropped': self.dropped,
+                'latency_avg': round(1000*self.latency_sum/count, 3),
+                'latency_max': round(1000*self.latency_max, 3),
+               }
+
+    def report(self, now):
+        """ publish stats and start a new latency interval """
+        self.stats_time = now
+        stats = self.stats()
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+        self.publish("/motorhome/publisher/" + self.client_id, json.dumps(stats))
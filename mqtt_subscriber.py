@@ -1,77 +1,118 @@
 """
 MQTT subscriber
+
+One client for the GUI. Every topic has its own callback, which puts
+the message with its time in its channel of the mailbox; the GUI drains
+it on its render tick. State topics are retained, so the last values
+arrive right after connecting. The paho network loop runs in the worker
+thread and returns as soon as stop() disconnects the client.
+
+With [LiveState] enabled the GUI reads the daemons' shared memory
+segments instead, LiveStateSubscriber puts their slots in the mailbox.
 """
-import paho.mqtt.client as mqtt
 import time
-import json
-import configparser
+import paho.mqtt.client as mqtt
 
-from pathlib import Path
 from PyQt5.QtCore import pyqtSignal, QObject
+from mqtt_payload import decode
+from live_state import StateReader
+
+def ruuvi_value(data, timestamp):
+    """ channel of the location and location, temperature, humidity,
+    pressure, battery """
+    location = data.get('location')
+    return ('ruuvi', location), (timestamp, (location, data.get('temperature'),
+                                             data.get('humidity'), data.get('pressure'),
+                                             data.get('battery')))
+
+def tpms_value(data, timestamp):
+    """ vehicle warn and tires, at the time of the frame """
+    return ('tpms',), (data.get('time', timestamp),
+                       (data.get('warn', 0), data.get('tires', [])))
+
+def gps_value(data, timestamp):
+    """ lat, lon, alt, speed, course, src, mode """
+    return ('gps',), (timestamp, (data.get('lat'), data.get('lon'), data.get('alt'),
+                                  data.get('speed'), data.get('course'), data.get('src'),
+                                  data.get('mode', 0)))
+
+# mailbox channel and value of a message by its id
+CHANNEL_VALUES = {'ruuvi': ruuvi_value, 'tpms': tpms_value, 'gps': gps_value}
 
 class MQTT(QObject):
     """ MQTT subcribers """
-    stop_signal = pyqtSignal()
-    start_signal = pyqtSignal()
     finished = pyqtSignal()
-    exit_signal = pyqtSignal()
 
-    """ Ruuvitag """
-    temperature = pyqtSignal(float)
-    humidity = pyqtSignal(float)
-    pressure = pyqtSignal(float)
-    ruuvi_batt = pyqtSignal(float)
+    def __init__(self, mailbox, parent=None):
+        QObject.__init__(self, parent=parent)
+        self.mailbox = mailbox
+        self.mqttBroker = 'localhost'
+        self.client = mqtt.Client("RPi")
+        self.client.on_connect = self.on_connect
+        self.client.message_callback_add("/motorhome/ruuvitag/+", self.on_ruuvi)
+        self.client.message_callback_add("/motorhome/tpms", self.on_tpms)
+        self.client.message_callback_add("/motorhome/gps", self.on_gps)
+
+    def on_connect(self, client, userdata, flags, rc):
+        """ subscribe on every connect, so reconnects renew them """
+        print("mqtt_subscriber: connected with result code " + str(rc))
+        client.subscribe([("/motorhome/ruuvitag/+", 0),
+                          ("/motorhome/tpms", 0),
+                          ("/motorhome/gps", 0)])
 
-    """ TPMS """
-    tpms = pyqtSignal(tuple)
-    tpms_warn = pyqtSignal(int)
+    def decode(self, message):
+        """ message dict of the payload, None if invalid """
+        try:
+            return decode(message.payload)
+        except ValueError as err:
+            print("mqtt_subscriber: invalid payload on " + message.topic + ": " + str(err))
+            return None
 
-    """ GPS """
-    gpsLocation = pyqtSignal(tuple)
-    gpsFix = pyqtSignal(int)
+    def on_ruuvi(self, client, userdata, message):
+        data = self.decode(message)
+        if data is not None:
+            self.mailbox.put(*ruuvi_value(data, time.time()))
 
-    def __init__(self, parent=None):
-        QObject.__init__(self, parent=parent)
-        self.mqttBroker = 'localhost'
-        self.running = True
-
-    def on_message(self, client, userdata, message):
-        decoded = str(message.payload.decode("utf-8","ignore"))
-        data = json.loads(decoded)
-
-        if data.get('id') == "ruuvi":
-            self.temperature.emit(data.get('temperature'))
-            self.humidity.emit(data.get('humidity'))
-            self.pressure.emit(data.get('pressure'))
-            self.ruuvi_batt.emit(data.get('battery'))
-        elif data.get('id') == "tpms":
-            self.tpms_warn.emit(data.get('tire').get('warn'))
-            tire = (data.get('tire').get('position'), data.get('tire').get('pressure'), data.get('tire').get('temperature'), data.get('tire').get('warn'))
-            self.tpms.emit(tire)
-        elif data.get('id') == "gps":
-            self.gpsFix.emit(data.get('mode'))
-            location = (data.get('lat'), data.get('lon'), data.get('alt'), data.get('speed'), data.get('course'), data.get('src'))
-            self.gpsLocation.emit(location)
+    def on_tpms(self, client, userdata, message):
+        data = self.decode(message)
+        if data is not None:
+            self.mailbox.put(*tpms_value(data, time.time()))
+
+    def on_gps(self, client, userdata, message):
+        data = self.decode(message)
+        if data is not None:
+            self.mailbox.put(*gps_value(data, time.time()))
 
     def run(self):
         print("mqtt_subscriber: Thread started")
-        self.client = mqtt.Client("RPi")
-        self.client.connect(self.mqttBroker)
-        self.client.loop_start()
-        self.client.subscribe("/motorhome/ruuvitag")
-        self.client.subscribe("/motorhome/tpms")
-        self.client.subscribe("/motorhome/gps")
-        self.client.on_message = self.on_message
-
-        while self.running:
-            time.sleep(1)
+        try:
+            self.client.connect(self.mqttBroker)
+            self.client.loop_forever()
+        except OSError as err:
+            print("mqtt_subscriber: " + str(err))
 
-        self.client.loop_stop()
         print("thread finished")
         self.finished.emit()
 
     def stop(self):
-        """ stop ruuvitag execution """
+        """ disconnect, the network loop of run() returns """
         print("mqtt_subscriber: received stop signal")
-        self.running = False
-        self.client.loop_stop()
+        self.client.disconnect()
+
+class LiveStateSubscriber:
+    """ Slots of the live state segments, polled on the render tick """
+    def __init__(self, mailbox, directory):
+        self.mailbox = mailbox
+        self.reader = StateReader(directory)
+
+    def poll(self):
+        for topic, timestamp, payload in self.reader.poll():
+            try:
+                data = decode(payload)
+            except ValueError as err:
+                print("mqtt_subscriber: invalid payload in " + topic + ": " + str(err))
+                continue
+
+            value = CHANNEL_VALUES.get(data.get('id'))
+            if value is not None:
+                self.mailbox.put(*value(data, timestamp))
@@ -1,26 +1,88 @@
 """
 Ruuvitag sensor data class
 """
-class Ruuvi:
-    """ Ruuvitag sensor class """
-    def __init__(self):
-        self.temperature = float('nan')
-        self.humidity = float('nan')
-        self.pressure = float('nan')
-        self.vbatt = float('nan')
-
-    def set_temperature(self, temp):
-        """ set temperature """
-        self.temperature = temp
-
-    def set_humidity(self, humidity):
-        """ set humidity """
-        self.humidity = humidity
-
-    def set_pressure(self, pressure):
-        """ set pressure """
-        self.pressure = pressure
-
-    def set_vbat(self, vbatt):
-        """ set battery voltage """
-        self.vbatt = vbatt
+import math
+import time
+import configparser
+from array import array
+
+# location of the tag shown on the infobar
+OUTDOOR = 'outdoor'
+
+def get_ruuvitag_locations(conf_file):
+    """ locations of the configured Ruuvitags, the plain mac key is outdoor """
+    config = configparser.ConfigParser()
+    locations = []
+
+    try:
+        config.read(conf_file)
+        for location in config['RuuviTag']:
+            if location == 'mac':
+                location = OUTDOOR
+            locations.append(location)
+    except (configparser.Error, KeyError):
+        print("ruuvi: no sensors configured")
+
+    return locations
+
+def to_float(value):
+    """ None (value not available) to nan """
+    if value is None:
+        return math.nan
+    return float(value)
+
+class RuuviTags:
+    """ Ruuvitag sensors, one row of values per location """
+    def __init__(self, locations=()):
+        self.locations = []
+        self.index = {}
+        self.temperature = array('d')
+        self.humidity = array('d')
+        self.pressure = array('d')
+        self.vbatt = array('d')
+        # time of the values
+        self.time = array('d')
+
+        for location in locations:
+            self.add(location)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def add(self, location):
+        """ add a row for location, returns the row id """
+        tag = self.index.get(location)
+        if tag is not None:
+            return tag
+
+        tag = len(self.locations)
+        self.index[location] = tag
+        self.locations.append(location)
+        self.temperature.append(math.nan)
+        self.humidity.append(math.nan)
+        self.pressure.append(math.nan)
+        self.vbatt.append(math.nan)
+        self.time.append(math.nan)
+
+        return tag
+
+    def update(self, location, temperature, humidity, pressure, vbatt, timestamp=None):
+        """ set values of location, returns the row id """
+        tag = self.index.get(location)
+        if tag is None:
+            tag = self.add(location)
+
+        self.temperature[tag] = to_float(temperature)
+        self.humidity[tag] = to_float(humidity)
+        self.pressure[tag] = to_float(pressure)
+        self.vbatt[tag] = to_float(vbatt)
+        self.time[tag] = time.time() if timestamp is None else timestamp
+
+        return tag
+
+    def get_temperature(self, location):
+        """ get temperature of location """
+        tag = self.index.get(location)
+        if tag is None:
+            return math.nan
+        return self.temperature[tag]
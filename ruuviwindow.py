@@ -7,6 +7,7 @@ import time
 import math
 from datetime import datetime, timedelta
 from pathlib import Path
+from snapshot import is_stale, format_age
 
 class RuuviWindow(QWidget):
     info = pyqtSignal(dict)
@@ -19,25 +20,44 @@ class RuuviWindow(QWidget):
         self.setWindowTitle("Ruuvitag")
         self.prefix = str(Path.home()) + "/.motorhome/res/"
 
-        outdoor = QLabel("OUTDOOR")
-        outdoor.setStyleSheet("font: bold 32px;"
-                              "color: white;")
-
-        self.temperatureLabel = QLabel()
-        self.temperatureLabel.setStyleSheet("font: bold 48px;"
-                                            "color: white;")
-
-        self.humidityLabel = QLabel()
-        self.humidityLabel.setStyleSheet("font: bold 48px;"
-                                         "color: white;")
-
-        self.pressureLabel = QLabel()
-        self.pressureLabel.setStyleSheet("font: bold 48px;"
-                                         "color: white;")
-
-        self.voltageLabel = QLabel()
-        self.voltageLabel.setStyleSheet("font: bold 24px;"
-                                        "color: yellow")
+        # one row per tag: location, temperature, humidity, pressure, battery
+        grid = QGridLayout()
+        self.temperatureLabels = []
+        self.humidityLabels = []
+        self.pressureLabels = []
+        self.voltageLabels = []
+
+        for tag, location in enumerate(ruuvi.locations):
+            locationLabel = QLabel(location.upper())
+            locationLabel.setStyleSheet("font: bold 24px;"
+                                        "color: white;")
+
+            temperatureLabel = QLabel()
+            temperatureLabel.setStyleSheet("font: bold 32px;"
+                                           "color: white;")
+
+            humidityLabel = QLabel()
+            humidityLabel.setStyleSheet("font: bold 24px;"
+                                        "color: white;")
+
+            pressureLabel = QLabel()
+            pressureLabel.setStyleSheet("font: bold 24px;"
+                                        "color: white;")
+
+            voltageLabel = QLabel()
+            voltageLabel.setStyleSheet("font: bold 18px;"
+                                       "color: yellow")
+
+            grid.addWidget(locationLabel, tag, 0, alignment=Qt.AlignLeft|Qt.AlignVCenter)
+            grid.addWidget(temperatureLabel, tag, 1, alignment=Qt.AlignRight|Qt.AlignVCenter)
+            grid.addWidget(humidityLabel, tag, 2, alignment=Qt.AlignRight|Qt.AlignVCenter)
+            grid.addWidget(pressureLabel, tag, 3, alignment=Qt.AlignRight|Qt.AlignVCenter)
+            grid.addWidget(voltageLabel, tag, 4, alignment=Qt.AlignRight|Qt.AlignVCenter)
+
+            self.temperatureLabels.append(temperatureLabel)
+            self.humidityLabels.append(humidityLabel)
+            self.pressureLabels.append(pressureLabel)
+            self.voltageLabels.append(voltageLabel)
 
         homeButton = QPushButton()
         homeButton.setIcon(QIcon(self.prefix + 'home.png'))
@@ -88,27 +108,56 @@ class RuuviWindow(QWidget):
         hbox1.addWidget(self.timeLabel,     alignment=Qt.AlignTop|Qt.AlignRight)
         # === infobar ===
 
-        self.updateTemperature(ruuvi.temperature)
-        self.updateHumidity(ruuvi.humidity)
-        self.updatePressure(ruuvi.pressure)
-        self.updateRuuviBatt(ruuvi.vbatt)
+        self.updateTemperature(infobar.temperature)
+        for tag in range(len(self.temperatureLabels)):
+            self.updateTag(ruuvi, tag)
 
         vbox = QVBoxLayout()
         vbox.addLayout(hbox1)
-        vbox.addWidget(outdoor, alignment=Qt.AlignLeft|Qt.AlignVCenter)
-        vbox.addWidget(self.temperatureLabel, alignment=Qt.AlignCenter|Qt.AlignVCenter)
-        vbox.addWidget(self.humidityLabel, alignment=Qt.AlignCenter|Qt.AlignVCenter)
-        vbox.addWidget(self.pressureLabel, alignment=Qt.AlignCenter|Qt.AlignVCenter)
-        vbox.addWidget(self.voltageLabel, alignment=Qt.AlignRight)
+        vbox.addLayout(grid)
         vbox.addWidget(homeButton, alignment=Qt.AlignCenter)
 
         self.setLayout(vbox)
 
         self.showFullScreen()
 
+    def updateTag(self, ruuvi, tag):
+        """ update values of one tag, tags added after opening are not shown """
+        if tag >= len(self.temperatureLabels):
+            return
+
+        temperature = ruuvi.temperature[tag]
+        if math.isnan(temperature):
+            self.temperatureLabels[tag].setText("--\u2103")
+        else:
+            self.temperatureLabels[tag].setText("{:.2f}".format(round(temperature, 2)) + "\u2103")
+
+        humidity = ruuvi.humidity[tag]
+        if math.isnan(humidity):
+            self.humidityLabels[tag].setText("-- %")
+        else:
+            self.humidityLabels[tag].setText("{:.2f}".format(round(humidity, 2)) + " %")
+
+        pressure = ruuvi.pressure[tag]
+        if math.isnan(pressure):
+            self.pressureLabels[tag].setText("-- hPa")
+        else:
+            self.pressureLabels[tag].setText("{:.2f}".format(round(pressure, 2)) + " hPa")
+
+        vbatt = ruuvi.vbatt[tag]
+        info = []
+        if not math.isnan(vbatt) and vbatt < 2.75:
+            info.append("low batt: " + "{:.2f}".format(round(vbatt, 2)) + " V")
+
+        # last known value, not heard from since
+        now = time.time()
+        if is_stale(ruuvi.time[tag], now):
+            info.append(format_age(now - ruuvi.time[tag]) + " ago")
+
+        self.voltageLabels[tag].setText(", ".join(info))
+
     def updateTemperature(self, temperature):
         if math.isnan(temperature):
-            self.temperatureLabel.setText("--\u2103")
             return
         if temperature < 3.0:
             self.tempWarnLabel.setPixmap(self.temp_warn_on)
@@ -116,25 +165,6 @@ class RuuviWindow(QWidget):
             self.tempWarnLabel.setPixmap(self.temp_warn_off)
 
         self.tempInfoLabel.setText("{0:d}".format(round(temperature)) + "\u2103")
-        self.temperatureLabel.setText("{:.2f}".format(round(temperature, 2)) + "\u2103")
-
-    def updateHumidity(self, humidity):
-        if math.isnan(humidity):
-            self.humidityLabel.setText("-- %")
-            return
-        self.humidityLabel.setText("{:.2f}".format(round(humidity, 2)) + " %")
-
-    def updatePressure(self, pressure):
-        if math.isnan(pressure):
-            self.pressureLabel.setText("-- hPa")
-            return
-        self.pressureLabel.setText("{:.2f}".format(round(pressure, 2)) + " hPa")
-
-    def updateRuuviBatt(self, vbatt):
-        if math.isnan(vbatt):
-            return
-        if vbatt < 2.75:
-            self.voltageLabel.setText("low batt: " + "{:.2f}".format(round(vbatt, 2)) + " V")
 
     def updateInfobar(self, data):
         self.updateTime(data['time'])
@@ -0,0 +1,54 @@
+"""
+Last known sensor values of the GUI
+
+The latest value of every mailbox channel is saved to
+~/.motorhome/snapshot.json every SNAPSHOT_INTERVAL seconds and at exit,
+and loaded at start, so the windows show the last values before the
+first message arrives. Values older than STALE_AGE seconds are shown
+with their age until a live value replaces them.
+"""
+import os
+import json
+from pathlib import Path
+
+SNAPSHOT_FILE = str(Path.home()) + "/.motorhome/snapshot.json"
+SNAPSHOT_INTERVAL = 60
+
+STALE_AGE = 120
+
+def is_stale(timestamp, now):
+    """ value of timestamp too old to be shown as live """
+    return now - timestamp > STALE_AGE
+
+def format_age(seconds):
+    """ age of a value, e.g. 45 s, 12 min, 3 h, 2 d """
+    if seconds < 60:
+        return "{:d} s".format(int(seconds))
+    if seconds < 3600:
+        return "{:d} min".format(int(seconds/60))
+    if seconds < 86400:
+        return "{:d} h".format(int(seconds/3600))
+    return "{:d} d".format(int(seconds/86400))
+
+def save_snapshot(values, path=SNAPSHOT_FILE):
+    """ write (timestamp, value) of each channel """
+    snapshot = [[list(channel), timestamp, data] for channel, (timestamp, data) in values.items()]
+
+    try:
+        with open(path + ".tmp", 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+    except OSError as err:
+        print("snapshot: unable to save: " + str(err))
+
+def load_snapshot(path=SNAPSHOT_FILE):
+    """ (timestamp, value) of each channel of the saved snapshot """
+    try:
+        with open(path, 'r') as f:
+            snapshot = json.load(f)
+        return {tuple(channel): (timestamp, data) for channel, timestamp, data in snapshot}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, TypeError) as err:
+        print("snapshot: unable to load: " + str(err))
+        return {}
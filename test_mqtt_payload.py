@@ -0,0 +1,41 @@
+"""
+Tests of the binary MQTT payloads, run with python -m unittest
+"""
+import unittest
+
+from mqtt_payload import encode, decode
+
+TPMS = {'id': 'tpms', 'time': 1700000000.25, 'warn': 0,
+        'tires': [['FL', 2.5, 21.5, 0, None],
+                  ['TrailerLeftOuter', 2.25, 19.0, 1, 0.5]]}
+
+RUUVI = {'id': 'ruuvi', 'location': 'outdoor', 'temperature': 24.25,
+         'humidity': 53.5, 'pressure': 1000.5, 'battery': 2977}
+
+GPS = {'id': "gps", 'lat': 60.1699, 'lon': 24.9384, 'alt': 12.5,
+       'speed': 22.5, 'course': 187.0, 'mode': 3, 'src': "internal"}
+
+class TestPayload(unittest.TestCase):
+    def test_long_tire_name(self):
+        tires = decode(encode(TPMS))['tires']
+        self.assertEqual([tire[0] for tire in tires], ['FL', 'TrailerLeftOuter'])
+        self.assertEqual(tires[1][1:], (2.25, 19.0, 1, 0.5))
+
+    def test_truncated(self):
+        for message in (TPMS, RUUVI, GPS):
+            payload = encode(message)
+            for length in range(1, len(payload)):
+                with self.subTest(id=message['id'], length=length):
+                    try:
+                        decode(payload[:length])
+                    except ValueError:
+                        pass
+
+    def test_foreign(self):
+        for payload in (b"\xa5", b"\xa5\x02", b"\xa5\x02\x09", b"\xa5\x02\x03\x09ab",
+                        b"\xa5\xff\xff\xff"):
+            with self.subTest(payload=payload):
+                self.assertRaises(ValueError, decode, payload)
+
+if __name__ == "__main__":
+    unittest.main()
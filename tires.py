@@ -1,75 +1,115 @@
 """
 Tire class for TPMS
+
+Tire positions are configured in motorhome.conf, one line per sensor
+with its label and grid row and column in the TPMS window, e.g. for twin
+rear wheels and a trailer:
+
+[TirePositions]
+FL = Front Left, 0, 0
+FR = Front Right, 0, 3
+RLO = Rear Left Outer, 1, 0
+RLI = Rear Left Inner, 1, 1
+RRI = Rear Right Inner, 1, 2
+RRO = Rear Right Outer, 1, 3
+TL = Trailer Left, 2, 0
+TR = Trailer Right, 2, 3
+Spear = Spear, 3, 0
+
+The sensor macs are given by position name in [TPMS_summer] and
+[TPMS_winter]. Without the section the positions are FL, FR, RL, RR and
+Spear.
 """
 import math
+import time
+import configparser
+from array import array
+
+from snapshot import is_stale
+
+# name, label, grid row and column
+DEFAULT_POSITIONS = (('FL', "Front Left", 0, 0),
+                     ('FR', "Front Right", 0, 1),
+                     ('RL', "Rear Left", 1, 0),
+                     ('RR', "Rear Right", 1, 1),
+                     ('Spear', "Spear", 2, 0),
+                    )
+
+def get_tire_positions(conf_file):
+    """ tire positions table of the conf file """
+    config = configparser.ConfigParser()
+    # position names are case sensitive
+    config.optionxform = str
+    positions = []
+
+    try:
+        config.read(conf_file)
+        for name, value in config['TirePositions'].items():
+            try:
+                label, row, column = [v.strip() for v in value.split(',')]
+                positions.append((name, label, int(row), int(column)))
+            except ValueError:
+                print("TPMS: invalid tire position " + name)
+    except (configparser.Error, KeyError):
+        pass
+
+    return positions or list(DEFAULT_POSITIONS)
 
-class Tire:
-    """ Single tire """
-    def __init__(self):
-        self.pressure = math.nan
-        self.temperature = math.nan
-        self.warn = 0
+class Tires:
+    """ Tire values, one row per position """
+    def __init__(self, positions=DEFAULT_POSITIONS):
+        self.positions = list(positions)
+        self.index = {position[0]: i for i, position in enumerate(self.positions)}
+
+        self.pressure = array('d', [math.nan]*len(self.positions))
+        self.temperature = array('d', [math.nan]*len(self.positions))
+        self.warn = array('b', bytes(len(self.positions)))
+        # time of the values
+        self.time = array('d', [math.nan]*len(self.positions))
+        self.warn_pressure = 0.0
 
-    def set_pressure(self, pressure):
-        """ set tire pressure """
-        self.pressure = pressure
+    def __len__(self):
+        return len(self.positions)
 
-    def set_temperature(self, temperature):
-        """ set tire temperature """
-        self.temperature = temperature
+    def update(self, tire, pressure, temperature, warn, timestamp=None):
+        """ set values of tire, returns its row id if any changed or the
+        old values were stale, else None """
+        i = self.index.get(tire)
+        if i is None:
+            return None
 
-    def set_warn(self, warn):
-        """ set tire pressure warn level """
-        self.warn = warn
+        if timestamp is None:
+            timestamp = time.time()
+        was_stale = is_stale(self.time[i], timestamp)
+        self.time[i] = timestamp
 
-class Tires:
-    """ Tire class """
-    def __init__(self):
-        self.front_left = Tire()
-        self.front_right = Tire()
-        self.rear_left = Tire()
-        self.rear_right = Tire()
-        self.spear = Tire()
-        self.warn_pressure = 0.0
+        if (pressure == self.pressure[i] and temperature == self.temperature[i]
+                and warn == self.warn[i] and not was_stale):
+            return None
+
+        self.pressure[i] = pressure
+        self.temperature[i] = temperature
+        self.warn[i] = warn
+
+        return i
 
     def set_pressure(self, tire, pressure):
         """ set tire pressure """
-        if tire == 'FL':
-            self.front_left.set_pressure(pressure)
-        elif tire == 'FR':
-            self.front_right.set_pressure(pressure)
-        elif tire == 'RL':
-            self.rear_left.set_pressure(pressure)
-        elif tire == 'RR':
-            self.rear_right.set_pressure(pressure)
-        elif tire == "Spear":
-            self.spear.set_pressure(pressure)
+        i = self.index.get(tire)
+        if i is not None:
+            self.pressure[i] = pressure
 
     def set_temperature(self, tire, temperature):
         """ set tire temperature """
-        if tire == 'FL':
-            self.front_left.set_temperature(temperature)
-        elif tire == 'FR':
-            self.front_right.set_temperature(temperature)
-        elif tire == 'RL':
-            self.rear_left.set_temperature(temperature)
-        elif tire == 'RR':
-            self.rear_right.set_temperature(temperature)
-        elif tire == "Spear":
-            self.spear.set_temperature(temperature)
+        i = self.index.get(tire)
+        if i is not None:
+            self.temperature[i] = temperature
 
     def set_warn(self, tire, val):
         """ set tire pressure warn level """
-        if tire == 'FL':
-            self.front_left.set_warn(val)
-        elif tire == 'FR':
-            self.front_right.set_warn(val)
-        elif tire == 'RL':
-            self.rear_left.set_warn(val)
-        elif tire == 'RR':
-            self.rear_right.set_warn(val)
-        elif tire == "Spear":
-            self.spear.set_warn(val)
+        i = self.index.get(tire)
+        if i is not None:
+            self.warn[i] = val
 
     def set_warn_pressure(self, val):
         """ set tire pressure warn level """
@@ -77,39 +117,24 @@ class Tires:
 
     def get_pressure(self, tire):
         """ get tire pressure """
-
-        pressure = 0.0
-
-        if tire == 'FL':
-            pressure = self.front_left.pressure
-        elif tire == 'FR':
-            pressure = self.front_right.pressure
-        elif tire == 'RL':
-            pressure = self.rear_left.pressure
-        elif tire == 'RR':
-            pressure = self.rear_right.pressure
-        elif tire == "Spear":
-            pressure = self.spear.pressure
-
-        return pressure
+        i = self.index.get(tire)
+        if i is None:
+            return math.nan
+        return self.pressure[i]
 
     def get_temperature(self, tire):
         """ get tire temperature """
-
-        temperature = 0.0
-
-        if tire == 'FL':
-            temperature = self.front_left.temperature
-        elif tire == 'FR':
-            temperature = self.front_right.temperature
-        elif tire == 'RL':
-            temperature = self.rear_left.temperature
-        elif tire == 'RR':
-            temperature = self.rear_right.temperature
-        elif tire == "Spear":
-            temperature = self.spear.temperature
-
-        return temperature
+        i = self.index.get(tire)
+        if i is None:
+            return math.nan
+        return self.temperature[i]
+
+    def get_warn(self, tire):
+        """ get tire warn """
+        i = self.index.get(tire)
+        if i is None:
+            return 0
+        return self.warn[i]
 
     def get_warn_pressure(self):
         """ get tire pressure warn level """
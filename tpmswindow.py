@@ -7,18 +7,10 @@ from PyQt5 import QtWidgets, QtCore, QtGui
 import time
 import math
 import configparser
-import paho.mqtt.client as mqtt
 from datetime import datetime, timedelta
 from pathlib import Path
 from tires import Tires
-
-# The callback for when the client receives a CONNACK response from the MQTT se>
-def on_connect(client, userdata, flags, rc):
-    print("Connected to MQTT broker with result code " + str(rc))
-
-    # Subscribing in on_connect() means that if we lose the connection and
-    # reconnect then subscriptions will be renewed.
-    client.subscribe("$SYS/#")
+from snapshot import is_stale, format_age
 
 class TPMSWindow(QWidget):
     set_season = pyqtSignal(int)
@@ -32,11 +24,6 @@ class TPMSWindow(QWidget):
         self.setWindowTitle("TPMS")
         self.prefix = str(Path.home()) + "/.motorhome/res/"
 
-        mqttBroker = 'localhost'
-        self.client = mqtt.Client("TPMS_window")
-        self.client.on_connect = on_connect
-        self.client.connect(mqttBroker)
-
         homeButton = QPushButton()
         homeButton.setIcon(QIcon(self.prefix + 'home.png'))
         homeButton.setIconSize(QSize(64, 64))
@@ -87,111 +74,47 @@ class TPMSWindow(QWidget):
         hbox1.addWidget(self.timeLabel, alignment=Qt.AlignTop|Qt.AlignRight)
         # === infobar ===
 
-        front_left = QLabel("Front Left")
-        front_left.setStyleSheet("font: bold 20px;")
-
-        front_right = QLabel("Front Right")
-        front_right.setStyleSheet("font: bold 20px;")
-
-        rear_left = QLabel("Rear Left")
-        rear_left.setStyleSheet("font: bold 20px;")
-
-        rear_right = QLabel("Rear Right")
-        rear_right.setStyleSheet("font: bold 20px;")
-
-        self.spear = QLabel()
-        self.spear.setStyleSheet("font: bold 18px;")
-
-        self.fl_pressure_label = QLabel()
-        self.fl_pressure_label.setStyleSheet("font: bold 28px;")
-
-        self.fr_pressure_label = QLabel()
-        self.fr_pressure_label.setStyleSheet("font: bold 28px;")
-
-        self.rl_pressure_label = QLabel()
-        self.rl_pressure_label.setStyleSheet("font: bold 28px;")
-
-        self.rr_pressure_label = QLabel()
-        self.rr_pressure_label.setStyleSheet("font: bold 28px;")
-
-        self.fl_temp_label = QLabel()
-        self.fl_temp_label.setStyleSheet("font: bold 20px;")
-
-        self.fr_temp_label = QLabel()
-        self.fr_temp_label.setStyleSheet("font: bold 20px;")
-
-        self.rl_temp_label = QLabel()
-        self.rl_temp_label.setStyleSheet("font: bold 20px;")
-
-        self.rr_temp_label = QLabel()
-        self.rr_temp_label.setStyleSheet("font: bold 20px;")
-
-        pixmap = QPixmap(self.prefix + "tire.png").scaled(128, 128, Qt.KeepAspectRatio)
-
-        tire_fl_label = QLabel()
-        tire_fl_label.setPixmap(pixmap)
-
-        tire_fr_label = QLabel()
-        tire_fr_label.setPixmap(pixmap)
-
-        tire_rl_label = QLabel()
-        tire_rl_label.setPixmap(pixmap)
-
-        tire_rr_label = QLabel()
-        tire_rr_label.setPixmap(pixmap)
+        # one cell of name, tire, pressure and temperature per position
+        columns = max(position[3] for position in tpms.positions) + 1
+        size = 128 if columns <= 2 else 64
+        pixmap = QPixmap(self.prefix + "tire.png").scaled(size, size, Qt.KeepAspectRatio)
+
+        grid = QGridLayout()
+        self.pressureLabels = []
+        self.tempLabels = []
+        for name, label, row, column in tpms.positions:
+            nameLabel = QLabel(label)
+            nameLabel.setStyleSheet("font: bold 20px;")
+
+            tireLabel = QLabel()
+            tireLabel.setPixmap(pixmap)
+
+            pressureLabel = QLabel()
+            pressureLabel.setStyleSheet("font: bold 28px;")
+            tempLabel = QLabel()
+            tempLabel.setStyleSheet("font: bold 20px;")
+            self.pressureLabels.append(pressureLabel)
+            self.tempLabels.append(tempLabel)
+
+            vbox = QVBoxLayout()
+            vbox.addWidget(nameLabel, alignment=Qt.AlignCenter|Qt.AlignBottom)
+            vbox.addWidget(tireLabel, alignment=Qt.AlignCenter)
+            vbox.addWidget(pressureLabel, alignment=Qt.AlignCenter|Qt.AlignBottom)
+            vbox.addWidget(tempLabel, alignment=Qt.AlignCenter|Qt.AlignTop)
+            grid.addLayout(vbox, row, column)
 
         tireSelLabel = QLabel("Winter tires")
         tireSelLabel.setStyleSheet("QLabel {background: transparent; color: #1E90FF; font: 16px}")
 
-        self.setTPMS(tpms, "FL")
-        self.setTPMS(tpms, "FR")
-        self.setTPMS(tpms, "RL")
-        self.setTPMS(tpms, "RR")
-        self.setTPMS(tpms, "Spear")
-
-        vbox1 = QVBoxLayout()
-        vbox1.addWidget(front_left, alignment=Qt.AlignCenter|Qt.AlignBottom)
-        vbox1.addWidget(self.fl_pressure_label, alignment=Qt.AlignCenter|Qt.AlignBottom)
-        vbox1.addWidget(self.fl_temp_label, alignment=Qt.AlignCenter|Qt.AlignTop)
-
-        vbox2 = QVBoxLayout()
-        vbox2.addWidget(front_right, alignment=Qt.AlignCenter|Qt.AlignBottom)
-        vbox2.addWidget(self.fr_pressure_label,alignment=Qt.AlignCenter|Qt.AlignBottom)
-        vbox2.addWidget(self.fr_temp_label, alignment=Qt.AlignCenter|Qt.AlignTop)
-
-        hbox2 = QHBoxLayout()
-        hbox2.addLayout(vbox1)
-        hbox2.addWidget(tire_fl_label, alignment=Qt.AlignLeft)
-        hbox2.addWidget(tire_fr_label, alignment=Qt.AlignRight)
-        hbox2.addLayout(vbox2)
-
-        vbox3 = QVBoxLayout()
-        vbox3.addWidget(rear_left, alignment=Qt.AlignCenter|Qt.AlignBottom)
-        vbox3.addWidget(self.rl_pressure_label, alignment=Qt.AlignCenter|Qt.AlignBottom)
-        vbox3.addWidget(self.rl_temp_label, alignment=Qt.AlignCenter|Qt.AlignTop)
-
-        vbox4 = QVBoxLayout()
-        vbox4.addWidget(rear_right, alignment=Qt.AlignCenter|Qt.AlignBottom)
-        vbox4.addWidget(self.rr_pressure_label, alignment=Qt.AlignCenter|Qt.AlignBottom)
-        vbox4.addWidget(self.rr_temp_label, alignment=Qt.AlignCenter|Qt.AlignTop)
-
-        hbox3 = QHBoxLayout()
-        hbox3.addLayout(vbox3)
-        hbox3.addWidget(tire_rl_label, alignment=Qt.AlignLeft)
-        hbox3.addWidget(tire_rr_label, alignment=Qt.AlignRight)
-        hbox3.addLayout(vbox4)
-
-        hbox4 = QHBoxLayout()
-        hbox4.addWidget(self.spear, alignment=Qt.AlignLeft)
+        for i in range(len(tpms)):
+            self.setTPMS(tpms, i)
 
         hbox5 = QHBoxLayout()
         hbox5.addWidget(homeButton, alignment=Qt.AlignCenter)
 
         vbox5 = QVBoxLayout()
         vbox5.addLayout(hbox1)
-        vbox5.addLayout(hbox2)
-        vbox5.addLayout(hbox3)
-        vbox5.addLayout(hbox4)
+        vbox5.addLayout(grid)
         vbox5.addLayout(hbox5)
 
         self.setLayout(vbox5)
@@ -204,78 +127,37 @@ class TPMSWindow(QWidget):
         else:
             self.tpmsWarnLabel.setPixmap(self.tpms_warn_off)
 
-    def setTPMS(self, tpms, tire):
-        if tire == "FL":
-            if math.isnan(tpms.front_left.pressure):
-                self.fl_pressure_label.setText(" -- bar")
-                self.fl_temp_label.setText("--\u2103")
-            else:
-                self.fl_pressure_label.setText("{:.1f}".format(round(tpms.front_left.pressure, 1)) + " bar")
-                self.fl_temp_label.setText("{:0d}".format(round(tpms.front_left.temperature)) + "\u2103")
-                if tpms.front_left.warn:
-                    self.fl_pressure_label.setStyleSheet("font: bold 24px;"
-                                                         "color: #ff9933;")
-                    self.fl_temp_label.setStyleSheet("font: bold 20px;"
-                                                     "color: #ff9933;")
-                else:
-                    self.fl_pressure_label.setStyleSheet("font: bold 24px;"
-                                                         "color: #73E420;")
-                    self.fl_temp_label.setStyleSheet("font: bold 20px;"
-                                                     "color: #73E420;")
-        elif tire == "FR":
-            if math.isnan(tpms.front_right.pressure):
-                self.fr_pressure_label.setText(" -- bar")
-                self.fr_temp_label.setText("--\u2103")
-            else:
-                self.fr_pressure_label.setText("{:.1f}".format(round(tpms.front_right.pressure, 1)) + " bar")
-                self.fr_temp_label.setText("{0:d}".format(round(tpms.front_right.temperature)) + "\u2103")
-                if tpms.front_right.warn:
-                    self.fr_pressure_label.setStyleSheet("font: bold 24px;"
-                                                         "color: #ff9933;")
-                    self.fr_temp_label.setStyleSheet("font: bold 20px;"
-                                                     "color: #ff9933;")
-                else:
-                    self.fr_pressure_label.setStyleSheet("font: bold 24px;"
-                                                         "color: #73E420;")
-                    self.fr_temp_label.setStyleSheet("font: bold 20px;"
-                                                     "color: #73E420;")
-        elif tire == "RL":
-            if math.isnan(tpms.rear_left.pressure):
-                self.rl_pressure_label.setText(" -- bar")
-                self.rl_temp_label.setText("--\u2103")
-            else:
-                self.rl_pressure_label.setText("{:.1f}".format(round(tpms.rear_left.pressure, 1)) + " bar")
-                self.rl_temp_label.setText("{0:d}".format(round(tpms.rear_left.temperature)) + "\u2103")
-                if tpms.rear_left.warn:
-                    self.rl_pressure_label.setStyleSheet("font: bold 24px;"
-                                                         "color: #ff9933;")
-                    self.rl_temp_label.setStyleSheet("font: bold 20px;"
-                                                     "color: #ff9933;")
-                else:
-                    self.rl_pressure_label.setStyleSheet("font: bold 24px;"
-                                                         "color: #73E420;")
-                    self.rl_temp_label.setStyleSheet("font: bold 20px;"
-                                                     "color: #73E420;")
-        elif tire == "RR":
-            if math.isnan(tpms.rear_right.pressure):
-                self.rr_pressure_label.setText(" -- bar")
-                self.rr_temp_label.setText("--\u2103")
-            else:
-                self.rr_pressure_label.setText("{:.1f}".format(round(tpms.rear_right.pressure, 1)) + " bar")
-                self.rr_temp_label.setText("{0:d}".format(round(tpms.rear_right.temperature)) + "\u2103")
-                if tpms.rear_right.warn:
-                    self.rr_pressure_label.setStyleSheet("font: bold 24px;"
-                                                         "color: #ff9933;")
-                    self.rr_temp_label.setStyleSheet("font: bold 20px;"
-                                                     "color: #ff9933;")
-                else:
-                    self.rr_pressure_label.setStyleSheet("font: bold 24px;"
-                                                         "color: #73E420;")
-                    self.rr_temp_label.setStyleSheet("font: bold 20px;"
-                                                     "color: #73E420;")
-        elif tire == "Spear":
-            if not math.isnan(tpms.spear.pressure):
-                self.spear.setText("Spear     {:.1f}".format(round(tpms.spear.pressure, 1)) + " bar / {0:d}".format(round(tpms.spear.temperature)) + "\u2103")
+    def setTPMS(self, tpms, i):
+        """ show values of tire position i """
+        pressureLabel = self.pressureLabels[i]
+        tempLabel = self.tempLabels[i]
+
+        if math.isnan(tpms.pressure[i]):
+            pressureLabel.setText(" -- bar")
+            tempLabel.setText("--\u2103")
+            return
+
+        pressureLabel.setText("{:.1f}".format(round(tpms.pressure[i], 1)) + " bar")
+        tempLabel.setText("{:0d}".format(round(tpms.temperature[i])) + "\u2103")
+
+        # last known value, not heard from since
+        now = time.time()
+        if is_stale(tpms.time[i], now):
+            tempLabel.setText(tempLabel.text() + " (" + format_age(now - tpms.time[i]) + ")")
+            pressureLabel.setStyleSheet("font: bold 24px;"
+                                        "color: #808080;")
+            tempLabel.setStyleSheet("font: bold 20px;"
+                                    "color: #808080;")
+        elif tpms.warn[i]:
+            pressureLabel.setStyleSheet("font: bold 24px;"
+                                        "color: #ff9933;")
+            tempLabel.setStyleSheet("font: bold 20px;"
+                                    "color: #ff9933;")
+        else:
+            pressureLabel.setStyleSheet("font: bold 24px;"
+                                        "color: #73E420;")
+            tempLabel.setStyleSheet("font: bold 20px;"
+                                    "color: #73E420;")
 
     def updateInfobar(self, data):
         self.updateTime(data['time'])
@@ -323,5 +205,4 @@ class TPMSWindow(QWidget):
             self.recInfoLabel.setPixmap(self.rec_off)
 
     def exit(self):
-        self.client.disconnect()
         self.close()